@@ -1,7 +1,9 @@
-from typing import List
+from typing import Dict, Iterator, List
 
 from data_container import DataContainer
+from dataset_registry import datasets
 from .TreeNode import TreeNode
+from .history import TreeHistory
 import paho.mqtt.client as mqtt
 
 class Tree:
@@ -11,6 +13,8 @@ class Tree:
     def __init__(self, instance_id):
         self.instance_id = instance_id
         self.root: TreeNode
+        #all nodes of the tree by id, kept up to date by setRoot, addChild and remove_child
+        self.nodes: Dict[str, TreeNode] = {}
         self.client: mqtt.client
         #clustering algorithm initial implementaion only provides pckmeans
         self.algorithm: str
@@ -18,50 +22,100 @@ class Tree:
         self.data_source: str = None
         self.data: DataContainer = None
         self.separator: str
+        #columns of the data source used for clustering (None for all columns)
+        self.columns: List[str] = None
+        #number of pckmeans restarts per node calculation and for explicit re cluster operations (None runs one re cluster
+        #restart per restart process)
+        self.n_init: int = 1
+        self.recluster_n_init: int = None
+        #number of forked processes restarts run in (1 runs them in the calling thread, forking from the threaded
+        #mqtt backend is opt in)
+        self.restart_jobs: int = 1
+        #number of forked processes sibling subtrees are recalculated in (1 calculates them sequentially, forking from the
+        #threaded mqtt backend is opt in)
+        self.subtree_jobs: int = 1
+        #only subtrees that cluster at least this many rows are worth a worker process
+        self.subtree_min_rows: int = 50000
+        #nodes with more rows are clustered with mini batch pckmeans
+        self.minibatch_threshold: int = 100000
+        #nodes with at least this many children use triangle inequality bounds in pckmeans
+        self.hamerly_min_clusters: int = 10
+        #undo/redo of operations on nodes
+        self.history = TreeHistory(self)
 
     def getNodeById(self, id) -> TreeNode:
         """Get node of tree by id"""
-        for node in self.flatten():
-            if node.id == id:
-                return node
-        return None
+        return self.nodes.get(id)
+
+    def registerNode(self, node: TreeNode):
+        """add node to the id lookup"""
+        self.nodes[node.id] = node
+
+    def unregisterNode(self, node: TreeNode):
+        """remove node and all nodes below it from the id lookup"""
+        for sub_node in self.iterNodes(node):
+            if self.nodes.get(sub_node.id) is sub_node:
+                del self.nodes[sub_node.id]
 
     def setRoot(self, rootID):
         """set root node of tree"""
         self.root = TreeNode(self, rootID, name=rootID)
+        self.nodes = {}
+        self.registerNode(self.root)
+        self.history.clear()
 
     def setClient(self, client):
         """set mqtt client"""
         self.client = client
 
-    def setInitialConfig(self, algorithm, data_source, separator):
-        """set configuration used for clustering"""
+    def setInitialConfig(self, algorithm, data_source, separator, columns=None):
+        """set configuration used for clustering, data_source can be a csv, parquet or arrow ipc/feather file"""
         self.algorithm = algorithm
         self.data_source = data_source
         self.separator = separator
+        self.columns = columns
     
     def loadData(self):
-        """load data into tree"""
-        self.data = self.setup_Container()
-        self.data.init_from_file()
+        """load data into tree, the dataset is shared with all sessions using the same source"""
+        self.release_data()
+        self.data = datasets.acquire(self.data_source, self.algorithm, self.separator, columns=self.columns)
         self.root.data = self.data
+        self.root.mark_dirty()
+        self.history.clear()
+
+    def release_data(self):
+        """release the dataset of the tree in the process wide registry"""
+        if self.data is not None:
+            datasets.release(self.data)
+            self.data = None
 
     def calculateClusters(self):
         """calculate cluster content of every tree node"""
         self.root.calculate_cluster()
 
+    def iterNodes(self, start_node: TreeNode = None, include_start_node: bool = True) -> Iterator[TreeNode]:
+        """lazily iterate nodes below start_node (default root) depth first, parents before their children"""
+        return Tree.iterSubtree(self.root if start_node is None else start_node, include_start_node)
+
+    def iterLeaves(self, start_node: TreeNode = None) -> Iterator[TreeNode]:
+        """lazily iterate leaf nodes below start_node (default root) from left to right"""
+        return (node for node in self.iterNodes(start_node) if node.is_leaf_node())
+
+    def iterSubtree(start_node: TreeNode, include_start_node: bool = True) -> Iterator[TreeNode]:
+        """depth first iteration with an explicit stack (no recursion, no intermediate lists)"""
+        stack = [start_node] if include_start_node else list(reversed(start_node.get_children()))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.get_children()))
+
     def flatten(self) -> List[TreeNode]:
         """get flat representation of tree containing all nodes"""
-        return Tree.recursiveGetChildren(self.root)
+        return list(self.iterNodes())
 
     def recursiveGetChildren(start_node: TreeNode, include_start_node: bool = True) -> List[TreeNode]:
-        """recursively get all children"""
-        temp = []
-        if include_start_node:
-            temp.append(start_node)
-        for child in start_node.get_children():
-            temp += Tree.recursiveGetChildren(child, True)
-        return temp
+        """get all children"""
+        return list(Tree.iterSubtree(start_node, include_start_node))
 
     def setup_Container(self) -> DataContainer:
         """setup a new data container"""
@@ -1,4 +1,5 @@
 import copy
+import hashlib
 import itertools
 import json
 import random
@@ -6,7 +7,9 @@ import textwrap
 from typing import Dict, List, Tuple
 from urllib.error import ContentTooShortError
 from data_container import DataContainer
-from.clusterCalculation import PCKMeans
+from.clusterCalculation import MiniBatchPCKMeans, PCKMeans
+from .pairwise_constraints import IncrementalConstraintStore, build_constraint_store
+from .subtree_scheduler import calculate_subtrees, fork_available
 import numpy as np
 from pandas import DataFrame
 from FeatureFinder.methods import *
@@ -32,6 +35,8 @@ class TreeNode:
         self.data:DataContainer = None
         #calculation related
         self.clusterObj: PCKMeans = None
+        #telemetry of the last calculation (iterations, objective, changed labels, timings)
+        self.fit_stats: Dict = None
         self.att_weights: List[float] = None
         self.q_indikators = []
         #list of value restrictions placed on values in node
@@ -41,9 +46,17 @@ class TreeNode:
         self.assigned_rows = {}
         #active query object for cluster
         self.active_learn_obj = ExploreConsolidate(self, 0)
-        #must link and cannot link constraints
-        self.ml_const: Dict[Tuple[int, int]: bool] = {}
-        self.cl_const: Dict[Tuple[int, int]: bool] = {}
+        #must link and cannot link constraints (unique row ids) answered for this node
+        self.constraint_store = IncrementalConstraintStore()
+        #incremental recalculation: true if inputs of the node or of a node below changed since the last calculation
+        self.dirty: bool = True
+        #hash of the inputs of the last clustering (see get_input_fingerprint)
+        self.input_fingerprint: str = None
+        #incremented whenever the data of the child nodes is reassigned
+        self.partition_version: int = 0
+        #last node info published by analyze_result and the state it was computed for
+        self.analysis: str = None
+        self.analysis_key = None
         #following 3 vars ONLY used for evaluation section of paper
         self.consts_quantile_05 = [['t_enth', 'computer', '>', 0.5834029951631305], ['t_enth', 'mobiltelefone', '>', 0.6295178649152985], ['f_enth', 'games', '>', 0.5686051368240777], ['f_enth', 'filme_musik', '>', 0.6085571702205556], ['a_enth', 'smart_home', '>', 0.5615370687681729], ['a_enth', 'haushaltsgeraete', '>', 0.6044028518718608], ['fo_enth', 'foto', '>', 0.6514313177481835], ['fo_enth', 'sports_freizeit', '>', 0.5254570277970521], ['sp_enth', 'foto', '>', 0.5398798993898182], ['sp_enth', 'sports_freizeit', '>', 0.601293559460641], ['o_enth', 'foto', '>', 0.5486481451234353], ['o_enth', 'sports_freizeit', '>', 0.5536582364203545]]
         self.consts_quantile_01 = [['t_enth', 'computer', '>', 0.5102119738687372], ['t_enth', 'mobiltelefone', '>', 0.5858057771909856], ['f_enth', 'games', '>', 0.4944430730083437], ['f_enth', 'filme_musik', '>', 0.5479722396395527], ['a_enth', 'smart_home', '>', 0.49818241467475544], ['a_enth', 'haushaltsgeraete', '>', 0.5526582868704523], ['fo_enth', 'foto', '>', 0.5471931572796063], ['fo_enth', 'sports_freizeit', '>', 0.5037217635391997], ['sp_enth', 'foto', '>', 0.5047057411870113], ['sp_enth', 'sports_freizeit', '>', 0.5712729671446625], ['o_enth', 'foto', '>', 0.509545996685354], ['o_enth', 'sports_freizeit', '>', 0.5197415911674129]]
@@ -56,6 +69,9 @@ class TreeNode:
         """add child node to node instance"""
         n_node = TreeNode(self.tree, id, parent=self, name=name)
         self.children.append(n_node)
+        self.mark_dirty()
+        self.tree.history.clear()
+        self.tree.registerNode(n_node)
         print("added new node nodename: " + n_node.name)
 
     def get_children(self) -> List['TreeNode']:
@@ -68,9 +84,19 @@ class TreeNode:
 
     def set_attribute_weights(self, n_weights):
         """set weights for attributes when clustering node content to lower hirarchie level"""
+        if self.data != None and n_weights != self.att_weights:
+            self.data.invalidate_matrix_cache(weights_only=True)
         self.att_weights = n_weights
+        self.mark_dirty()
         self.calculate_cluster()
 
+    def mark_dirty(self):
+        """mark node for recalculation after its inputs changed, ancestors are marked to reach it from the root"""
+        node = self
+        while node is not None:
+            node.dirty = True
+            node = node.parent
+
     def isRoot(self):
         """check if node is root node of true
 
@@ -100,64 +126,185 @@ class TreeNode:
             data += json.loads(child.data.get_data_table_data(child.id))
         return json.dumps(data)    
 
-    def calculate_cluster(self):
-        """Calculate a clustering result for the current node"""
+    def calculate_cluster(self, n_init=None, touched_row_ids=None, inputs_changed=True):
+        """Calculate a clustering result for the current node
+
+        Nodes whose inputs did not change since the last calculation keep their clustering result and child partition
+        and republish their previous node info, subtrees without dirty nodes are not recalculated at all.
+
+        Args:
+            n_init (int, optional): number of parallel restarts for this node, uses the tree default if None
+            touched_row_ids (List[int], optional): unique row ids affected by a small change (new constraint, manual assignment),
+                if given the previous result is refined (warm start) and child nodes are skipped when no label changed
+            inputs_changed (bool, optional): false if the parent kept its partition, i.e. the data of this node did not change
+        """
         #init timing vars
         end = 0
         start = 0
+        if not inputs_changed and not self.dirty and self.analysis != None:
+            #nothing changed in this subtree --> previous results are still valid
+            for node in self.tree.iterNodes(self):
+                node.publish_analysis()
+            return end-start
+        was_dirty = self.dirty
+        reused = False
         if len(self.get_children()) > 0 and self.data != None:
             #get weights
-            weights = self.att_weights
+            weights = self.get_attribute_weights()
             hier_rest = self.get_child_node_hier_restrictions()
-            if weights == None:
-                weights = [1] * len(self.data.get_attributes_of_dataset_no_class())
-            if self.clusterObj == None or len(self.get_children()) != self.clusterObj.n_clusters:
-                if self.clusterObj == None:
-                    self.clusterObj = PCKMeans(self.get_num_clust())
-                self.clusterObj.att_weights = np.array(weights)
-                self.clusterObj.hier_rest = hier_rest
-                #case more children (more clusters) than previous calculation --> not complete recalc but use previous centers and add new ones
-                if len(self.get_children()) > self.clusterObj.n_clusters:
-                    self.clusterObj.n_clusters = len(self.get_children())
-                    self.clusterObj.init_centers(self.data.get_data_as_nparray_no_class(), recalc=False)
-                #otherwise find completly new clusters
-                else:
-                    self.clusterObj.n_clusters = len(self.get_children())
-                    self.clusterObj.init_centers(self.data.get_data_as_nparray_no_class())
+            X = self.data.get_data_as_nparray_no_class()
+            X_weighted = self.data.get_weighted_data_no_class(weights)
+            #get constraints, preprocessed once for center initialization and fit
+            ml, cl = self.get_applicable_constraints()
             #get manually assigned rows
             rel_assigned_rows = self.get_manually_assigned_nodes_calc()
-            self.clusterObj.manually_assigned = rel_assigned_rows
-            #get feature weights
+            cluster_class = self.get_cluster_class()
+            fingerprint = self.get_input_fingerprint(weights, hier_rest, ml, cl, rel_assigned_rows, cluster_class)
+            #explicit restarts and warm starts always fit, otherwise unchanged inputs keep the previous result
+            reused = (n_init == None and touched_row_ids == None and self.clusterObj != None and fingerprint == self.input_fingerprint
+                      and all(child.data != None for child in self.get_children()))
+            if reused:
+                print(f"reused node {self.name}: inputs unchanged")
+            else:
+                start, end = self.fit_node(X, X_weighted, weights, hier_rest, ml, cl, rel_assigned_rows, cluster_class, n_init, touched_row_ids)
+            self.input_fingerprint = fingerprint
+            self.dirty = False
+            if touched_row_ids != None and self.clusterObj.n_changed_ == 0 and all(child.data != None for child in self.get_children()):
+                #warm start did not change any label --> content of child nodes is still valid, their node info is republished
+                for node in self.tree.iterNodes(self, include_start_node=False):
+                    node.publish_analysis()
+            else:
+                if not reused:
+                    #self.evaluate_result(self.clusterObj.labels_)
+                    self.partition_children()
+                    print(f"calculated node {self.name}: {self.fit_stats['iterations']} iterations, assignment {self.fit_stats['assign_time']:.3f}s, "
+                          f"center update {self.fit_stats['update_time']:.3f}s, partition {self.fit_stats['partition_time']:.3f}s")
+                self.calculate_children(inputs_changed=not reused)
+        self.dirty = False
+        analysis_key = (self.input_fingerprint, self.partition_version, None if self.isRoot() else self.get_parent().partition_version)
+        #leaves have no fingerprint, their node info is only reused if they were reached without changes
+        if self.analysis != None and self.analysis_key == analysis_key and (reused or not was_dirty):
+            self.publish_analysis()
+        else:
+            self.analyze_result()
+            self.analysis_key = analysis_key
+        return end-start
+
+    def fit_node(self, X, X_weighted, weights, hier_rest, ml, cl, rel_assigned_rows, cluster_class, n_init=None, touched_row_ids=None):
+        """fit the pckmeans model of the node (see calculate_cluster), returns start and end time of the fit"""
+        constraints = build_constraint_store(ml, cl, X.shape[0])
+        if self.clusterObj != None:
+            #fit on a copy, previous results (labels, centers) may still be referenced by the tree history
+            self.clusterObj = copy.copy(self.clusterObj)
+        if self.clusterObj != None and type(self.clusterObj) != cluster_class:
+            #node size crossed the mini batch threshold --> switch variant but keep the current centers
+            prev_cluster_obj = self.clusterObj
+            self.clusterObj = cluster_class(prev_cluster_obj.n_clusters)
+            self.clusterObj.cluster_centers = prev_cluster_obj.cluster_centers
+        if self.clusterObj == None or len(self.get_children()) != self.clusterObj.n_clusters:
+            if self.clusterObj == None:
+                self.clusterObj = cluster_class(self.get_num_clust())
             self.clusterObj.att_weights = np.array(weights)
-            #get hierarchical restrictions
             self.clusterObj.hier_rest = hier_rest
-            #get constraints
-            ml, cl = self.get_applicable_constraints()
-            start = time.time()
-            self.clusterObj.fit(self.data.get_data_as_nparray_no_class(), y=None, ml=ml, cl=cl)
-            end = time.time()
-            #self.evaluate_result(self.clusterObj.labels_)
-            local_data = self.data.get_unique_id_data()
-            local_unencoded_data = self.data.get_unencoded_unique_id_data()
-            for child_index, child in enumerate(self.get_children()):
-                child.data = DataContainer.from_data_container(self.data)
-                child_data_content = []
-                unencoded_child_data_content = []
-                #assign data tuples that got clustered into child into child data contaienr
-                for tuple_index, label in enumerate(self.clusterObj.labels_):
-                    if child_index == label:
-                        child_data_content.append(local_data[tuple_index])
-                        unencoded_child_data_content.append(local_unencoded_data[tuple_index])
-                child.data.df_with_unique_rowid = DataFrame(child_data_content, columns=self.data.get_attributes_of_dataset_with_unique())
-                child.data.unencoded_df_unique_row_id = DataFrame(unencoded_child_data_content, columns=self.data.get_attributes_of_dataset_with_unique())
-                child.data.set_df_from_unique_df()
-                child.data.set_data_from_df()
-                child.data.set_unencoded_df_from_unencoded_unique()
-                #child.data.df = DataFrame(child_data_content, columns=self.data.get_attributes_of_dataset())
-            for child in self.get_children():
-                child.calculate_cluster()
-        self.analyze_result()
-        return end-start
+            #case more children (more clusters) than previous calculation --> not complete recalc but use previous centers and add new ones
+            if len(self.get_children()) > self.clusterObj.n_clusters:
+                self.clusterObj.n_clusters = len(self.get_children())
+                self.clusterObj.init_centers(X, recalc=False, X_weighted=X_weighted, constraints=constraints)
+            #otherwise find completly new clusters
+            else:
+                self.clusterObj.n_clusters = len(self.get_children())
+                self.clusterObj.init_centers(X, X_weighted=X_weighted, constraints=constraints)
+        self.clusterObj.manually_assigned = rel_assigned_rows
+        #get feature weights
+        self.clusterObj.att_weights = np.array(weights)
+        #get hierarchical restrictions
+        self.clusterObj.hier_rest = hier_rest
+        #number of restarts of which the best result is kept
+        self.clusterObj.n_init = n_init if n_init != None else self.tree.n_init
+        self.clusterObj.n_jobs = self.tree.restart_jobs
+        #bounded iterations pay off for nodes with many children
+        self.clusterObj.algorithm = "hamerly" if self.get_num_clust() >= self.tree.hamerly_min_clusters else "lloyd"
+        start = time.time()
+        if touched_row_ids != None:
+            touched_rows = self.data.get_unique_row_id_indices([int(r_id) for r_id in touched_row_ids])
+            touched_rows = touched_rows[touched_rows != -1]
+            self.clusterObj.refit(X, touched_rows, X_weighted=X_weighted, constraints=constraints)
+        else:
+            self.clusterObj.fit(X, y=None, X_weighted=X_weighted, constraints=constraints)
+        end = time.time()
+        self.fit_stats = dict(self.clusterObj.fit_stats_, node_time=end-start)
+        return start, end
+
+    def partition_children(self):
+        """assign the rows of the node to the child nodes according to the labels of the clustering result"""
+        partition_start = time.time()
+        #one stable argsort groups the rows per label in their original order
+        labels = self.clusterObj.labels_
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(self.get_num_clust() + 1))
+        for child_index, child in enumerate(self.get_children()):
+            #child data is a view on the rows of the tree data, frames are only built when requested
+            child.data = self.data.create_view(order[bounds[child_index]:bounds[child_index + 1]])
+        self.partition_version += 1
+        self.fit_stats["partition_time"] = time.time() - partition_start
+
+    def calculate_children(self, inputs_changed=True):
+        """calculate the subtrees of all child nodes, subtrees that have to be clustered again and hold at least
+        subtree_min_rows rows run in parallel processes if the tree allows more than one job, results and node infos are
+        merged in the order of the sequential calculation"""
+        #leaves are only analyzed, small subtrees do not pay off the worker process
+        pending = [child for child in self.get_children() if (inputs_changed or child.dirty) and not child.is_leaf_node()
+                   and child.data != None and child.data.get_length() >= self.tree.subtree_min_rows]
+        results = {}
+        if len(pending) > 1 and self.tree.subtree_jobs > 1 and fork_available():
+            results = calculate_subtrees(self.tree, pending, inputs_changed, self.tree.subtree_jobs)
+        for child in self.get_children():
+            if child.id not in results:
+                child.calculate_cluster(inputs_changed=inputs_changed)
+                continue
+            states, messages = results[child.id]
+            #parents come first, their partition creates the data of their children
+            for state in states:
+                self.tree.getNodeById(state["id"]).apply_calculation_state(state)
+            for topic, payload, qos in messages:
+                self.tree.client.publish(topic, payload, qos=qos)
+
+    def apply_calculation_state(self, state):
+        """take over the result of a calculation in a worker process (see subtree_scheduler)"""
+        self.clusterObj = state["clusterObj"]
+        self.fit_stats = state["fit_stats"]
+        self.q_indikators = state["q_indikators"]
+        self.input_fingerprint = state["input_fingerprint"]
+        self.analysis = state["analysis"]
+        self.analysis_key = state["analysis_key"]
+        self.dirty = state["dirty"]
+        if state["partition_version"] != self.partition_version:
+            #child data views are rebuilt from the labels, same partition as in the worker
+            self.partition_children()
+            self.partition_version = state["partition_version"]
+
+    def get_input_fingerprint(self, weights, hier_rest, ml, cl, rel_assigned_rows, cluster_class) -> str:
+        """hash of everything the clustering result of the node depends on: rows, attribute weights, restrictions and ids
+        of the child nodes, constraints, manually assigned rows and the pckmeans variant"""
+        fingerprint = hashlib.sha1()
+        fingerprint.update(np.ascontiguousarray(self.data.get_row_ids(), dtype=np.int64).tobytes())
+        fingerprint.update(np.asarray(ml, dtype=np.int64).tobytes() + b"|" + np.asarray(cl, dtype=np.int64).tobytes())
+        fingerprint.update(json.dumps([self.data.dataset, self.data.separator, self.data.encoding, self.data.columns,
+                                       [float(weight) for weight in weights], hier_rest, [child.id for child in self.get_children()],
+                                       rel_assigned_rows, cluster_class.__name__], default=str).encode())
+        return fingerprint.hexdigest()
+
+    def get_attribute_weights(self) -> List[float]:
+        """get attribute weights of node, every attribute has weight 1 if none were set"""
+        if self.att_weights == None:
+            return [1] * len(self.data.get_attributes_of_dataset_no_class())
+        return self.att_weights
+
+    def get_cluster_class(self):
+        """get pckmeans variant for the node, nodes with more rows than the tree threshold use mini batches"""
+        if self.data.get_length() > self.tree.minibatch_threshold:
+            return MiniBatchPCKMeans
+        return PCKMeans
 
     def evaluate_result(self, labels):
         """Evaluates the result for eval section of paper"""
@@ -222,7 +369,7 @@ class TreeNode:
         #evaluation for result using predefined labels from data generation
         #first get final result of all leaf nodes
         df_list = []
-        for i_index, leaf_node in enumerate([node for node in self.tree.flatten() if node.is_leaf_node()]):
+        for i_index, leaf_node in enumerate(self.tree.iterLeaves()):
             df_list.append(leaf_node.data.get_df_clabel(i_index))
         res_data = pd.concat(df_list)
         temp_df = copy.deepcopy(res_data)
@@ -371,13 +518,16 @@ class TreeNode:
 
     def re_cluster(self):
         """apply re cluster operation on node"""
+        self.tree.history.clear()
+        n_init = self.tree.recluster_n_init if self.tree.recluster_n_init != None else self.tree.restart_jobs
         if self.clusterObj == None:
-            self.calculate_cluster()
+            self.calculate_cluster(n_init=n_init)
         elif len(self.get_children()) > 0:
             #set cluster amount of cluster object and reset cluster centers
             self.clusterObj.n_clusters = len(self.get_children())
-            self.clusterObj.init_centers(self.data.get_data_as_nparray_no_class())
-            self.calculate_cluster()
+            self.clusterObj.att_weights = np.array(self.get_attribute_weights())
+            self.clusterObj.init_centers(self.data.get_data_as_nparray_no_class(), X_weighted=self.data.get_weighted_data_no_class(self.get_attribute_weights()))
+            self.calculate_cluster(n_init=n_init)
 
     def get_index_of_child(self, node_id: str) -> int:
         """get list index of a child node by node id"""
@@ -397,12 +547,13 @@ class TreeNode:
                 if not str(rest[2]).replace('.','',1).isdigit():
                     #encode
                     try:
-                        rest[2] = self.data.d[rest[0]].transform([rest[2]])[0]
-                    except:
+                        rest[2] = self.data.encode_value(rest[0], rest[2])
+                    except KeyError:
                         continue
                 rest[0] = ind
                 h_rest.append(rest)
         self.hier_restrictions = h_rest
+        self.get_parent().mark_dirty()
         self.get_parent().calculate_cluster()
 
     def append_hier_restriction(self, rest, child_index):
@@ -413,23 +564,21 @@ class TreeNode:
             if not str(rest[2]).replace('.','',1).isdigit():
                 #encode
                 try:
-                    rest[2] = self.data.d[rest[0]].transform([rest[2]])[0]
-                except:
+                    rest[2] = self.data.encode_value(rest[0], rest[2])
+                except KeyError:
                     pass
             rest[0] = ind
             self.children[child_index].hier_restrictions.append(rest)
+            self.mark_dirty()
+            self.tree.history.clear()
 
     def get_manually_assigned_nodes_calc(self):
         rel_assigned_rows = []
         for child in self.get_children():
-            temp_res = []
-            temp_assigned = list(child.assigned_rows.keys())
+            temp_assigned = [int(r_id) for r_id in child.assigned_rows.keys()]
             #map row ids to indexes in current dataset if applicable
-            for r_id in temp_assigned:
-                mapped_id = self.data.get_unique_row_id_index(int(r_id))
-                if mapped_id != -1:
-                    temp_res.append(mapped_id)
-            rel_assigned_rows.append(temp_res)
+            mapped_ids = self.data.get_unique_row_id_indices(temp_assigned)
+            rel_assigned_rows.append(mapped_ids[mapped_ids != -1].tolist())
         return rel_assigned_rows
 
     def get_attribute_index(self, attribute_name):
@@ -465,46 +614,39 @@ class TreeNode:
     def answer_act_query(self, q_answ: bool):
         """process an answer to a previous active query"""
         self.active_learn_obj.query_answer(q_answ)
-        ml, cl = self.active_learn_obj.get_pairwise_const()
-        for const in ml:
-            self.ml_const[const] = True
-        for const in cl:
-            self.cl_const[const] = True
-        self.calculate_cluster()
+        #rows whose constraints changed with this answer
+        touched = self.constraint_store.add_neighborhoods(self.active_learn_obj.neighborhoods)
+        self.mark_dirty()
+        self.tree.history.clear()
+        self.calculate_cluster(touched_row_ids=list(touched))
 
-    def get_applicable_constraints(self) -> List[Tuple[int, int]]:
-        """get applicable constraints"""
-        ml = list(self.ml_const.keys())
-        cl = list(self.cl_const.keys())
-        ml_app = []
-        cl_app = []
-        for const in ml:
-            #check if both parts of constraints are present in current data container
-            if self.data.get_unique_row_id_index(const[0]) != -1 and self.data.get_unique_row_id_index(const[1]) != -1:
-                ml_app.append(const)
-        for const in cl:
-            #check if both parts of constraints are present in current data container
-            if self.data.get_unique_row_id_index(const[0]) != -1 and self.data.get_unique_row_id_index(const[1]) != -1:
-                cl_app.append(const)
-        return ml, cl
+    def get_applicable_constraints(self) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+        """get must link and cannot link constraints between rows present in the node (as positions in the data container)"""
+        return self.constraint_store.get_applicable_constraints(self.data.get_unique_row_id_indices)
 
 
     def remove_child(self, node_id: str):
         """removes child node by node id"""
         child_index = self.get_index_of_child(node_id)
         if child_index != -1:
+            self.tree.unregisterNode(self.children[child_index])
             del self.children[child_index]
+            self.mark_dirty()
+            self.tree.history.clear()
         self.calculate_cluster()
 
     def assign_row_to_cluster(self, row_id):
         """update manual row assignment"""
-        #delete manual assignment of node from all siblings
+        #delete manual assignment of node from all siblings (assignments are replaced not modified, see tree history)
         to_remove = self.get_siblings()
         for node in to_remove:
             if row_id in node.assigned_rows:
-                del node.assigned_rows[row_id]
+                node.assigned_rows = {r_id: True for r_id in node.assigned_rows if r_id != row_id}
         #assign row to self
-        self.assigned_rows[row_id] = True
+        self.assigned_rows = {**self.assigned_rows, row_id: True}
+        #manual assignments are inputs of the parent clustering
+        if not self.isRoot():
+            self.get_parent().mark_dirty()
 
 
     def analyze_result(self):
@@ -539,8 +681,8 @@ class TreeNode:
             #check if is numeric
             if att not in self.data.string_columns:
                 #get range
-                min_val = self.data.df[att].min()
-                max_val = self.data.df[att].max()
+                min_val = self.data.get_attribute(att).min()
+                max_val = self.data.get_attribute(att).max()
                 important_within_thresholds.append([min_val, max_val])
             else:
                 important_within_thresholds.append(["-", "-"])
@@ -551,8 +693,8 @@ class TreeNode:
             #check if is numeric
             if att not in self.data.string_columns:
                 #get range
-                min_val = str(round(self.data.df[att].min(), 2))
-                max_val = str(round(self.data.df[att].max(), 2))
+                min_val = str(round(self.data.get_attribute(att).min(), 2))
+                max_val = str(round(self.data.get_attribute(att).max(), 2))
                 important_within_thresholds.append([min_val, max_val])
             else:
                 important_within_thresholds.append(["-", "-"])
@@ -560,8 +702,8 @@ class TreeNode:
             #check if is numeric
             if att not in self.data.string_columns:
                 #get range
-                min_val = str(round(self.data.df[att].min(), 2))
-                max_val = str(round(self.data.df[att].max(), 2))
+                min_val = str(round(self.data.get_attribute(att).min(), 2))
+                max_val = str(round(self.data.get_attribute(att).max(), 2))
                 important_between_thresholds.append([min_val, max_val])
             else:
                 important_between_thresholds.append(["-", "-"])
@@ -579,21 +721,39 @@ class TreeNode:
         "sorted_feature_importance_indice": sorted_feature_importance_indice,
         "stat_summary": self.data.get_data_summary(),
         "quality_indicator_list": self.q_indikators,
+        "fit_stats": self.get_fit_stats(),
         }
+        self.analysis = json.dumps(data)
+        self.publish_analysis()
+
+    def publish_analysis(self):
+        """send the last node info to the frontend"""
+        if self.analysis == None:
+            return
         self.tree.client.publish("clustering_communicator/frontend/nodeInfoUpdateFrontend",
-                json.dumps(data), qos=2)
+                self.analysis, qos=2)
+
+    def get_fit_stats(self):
+        """get telemetry of the last calculation in json serializable form"""
+        if self.fit_stats == None:
+            return None
+        stats = dict(self.fit_stats)
+        #infinite objective (violated value restriction) is not valid json
+        stats["objective"] = [val if np.isfinite(val) else None for val in stats["objective"]]
+        return stats
 
     def calc_quality_indicators(self):
         """calc data quality indicators"""
         q_indi = "-"
         self.q_indikators = []
         try:
+            X = self.data.get_data_as_nparray_no_class()
             #-1, 1
-            sil = metrics.silhouette_score(self.data.get_data_as_nparray_no_class(), self.clusterObj.labels_, metric='euclidean')
+            sil = metrics.silhouette_score(X, self.clusterObj.labels_, metric='euclidean')
             self.q_indikators.append(["Silhouettenkoeffizient", sil, "Der Wert des Indikators bewegt sich im Bereich [-1, 1] je höher der Wert desto besser"])
-            cal_harab = metrics.calinski_harabasz_score(self.data.get_data_as_nparray_no_class(), self.clusterObj.labels_)
+            cal_harab = metrics.calinski_harabasz_score(X, self.clusterObj.labels_)
             self.q_indikators.append(["Calinski-Harabasz", cal_harab, "Der Wert des Indikators bewegt sich im Bereich [0, inf] je höher der Wert desto besser"])
-            davies = metrics.davies_bouldin_score(self.data.get_data_as_nparray_no_class(), self.clusterObj.labels_)
+            davies = metrics.davies_bouldin_score(X, self.clusterObj.labels_)
             self.q_indikators.append(["Davies-Bouldin", davies, "Je höher der Wert desto besser"])
             q_indi = sil
         except:
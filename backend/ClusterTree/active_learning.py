@@ -46,7 +46,7 @@ class ExploreConsolidate:
             self.reset()
             self.n_clusters = len(self.node.get_children())
             return self.fit_step()
-        if self.n_clusters == 0 or type(self.node.data.df_with_unique_rowid) != pd.DataFrame:
+        if self.n_clusters == 0 or not self.node.data.is_loaded():
             return None
         if self.node.att_weights == None:
             self.node.att_weights =  [1] * len(self.node.data.get_attributes_of_dataset_no_class())
@@ -129,9 +129,17 @@ class ExploreConsolidate:
 
 
 
+    def _get_index(self, true_data_id, orig_n, row_id):
+        """position of a row id in the node data (row id index of the container) or among the rows mapped from global data"""
+        index = self.node.data.get_unique_row_id_index(row_id)
+        if index == -1:
+            index = true_data_id.index(row_id, orig_n)
+        return index
+
     def mapping_madness(self):
-        #get data
-        X = list(self.node.data.get_data_as_nparray_no_class())
+        #get attribute weighted data (cached by the node), rows mapped from global data are weighted the same way
+        weights = np.array(self.node.att_weights)
+        X = list(self.node.data.get_weighted_data_no_class(self.node.att_weights))
         #get (tree) unique indexes of data
         true_data_id: List['any'] = self.node.data.get_data_true_id()
         orig_n = len(X)
@@ -143,7 +151,7 @@ class ExploreConsolidate:
             for neighbor in neighborhood:
                 try:
                     #if instacne is stil in parent node this should work
-                    index = true_data_id.index(neighbor)
+                    index = self._get_index(true_data_id, orig_n, neighbor)
                     m_neighborhood.append(index)
                 except:
                     #check if count of instances that need to be mapped from global are within limits
@@ -157,7 +165,7 @@ class ExploreConsolidate:
                     if g_index == -1:
                         self.reset()
                         return self._explore_step(self.n_clusters)
-                    data = np.array(g_data.df.iloc[g_index].values.tolist()[:-1])
+                    data = np.array(g_data.df.iloc[g_index].values.tolist()[:-1]) * weights
                     X.append(data)
                     true_data_id.append(g_index)
                     m_neighborhood.append(len(true_data_id)-1)
@@ -168,7 +176,7 @@ class ExploreConsolidate:
         for elem in self.traversed:
             try:
                 #if instacne is stil in parent node this should work
-                index = true_data_id.index(elem)
+                index = self._get_index(true_data_id, orig_n, elem)
                 m_traversed.append(index)
             except:
                 #check if count of instances that need to be mapped from global are within limits
@@ -182,7 +190,7 @@ class ExploreConsolidate:
                 if g_index == -1:
                     self.reset()
                     return self._explore_step(self.n_clusters)
-                data = np.array(g_data.df.iloc[g_index].values.tolist()[:-1])
+                data = np.array(g_data.df.iloc[g_index].values.tolist()[:-1]) * weights
                 X.append(data)
                 true_data_id.append(g_index)
                 m_traversed.append(len(true_data_id)-1)
@@ -192,7 +200,7 @@ class ExploreConsolidate:
         if self.farthest != None:
             try:
                 #if instacne is stil in parent node this should work
-                index = true_data_id.index(self.farthest)
+                index = self._get_index(true_data_id, orig_n, self.farthest)
                 m_farthest = index
             except:
                 #check if count of instances that need to be mapped from global are within limits
@@ -206,7 +214,7 @@ class ExploreConsolidate:
                 if g_index == -1:
                     self.reset()
                     return self._explore_step(self.n_clusters)
-                data = np.array(g_data.df.iloc[g_index].values.tolist()[:-1])
+                data = np.array(g_data.df.iloc[g_index].values.tolist()[:-1]) * weights
                 X.append(data)
                 true_data_id.append(g_index)
                 m_farthest.append(len(true_data_id)-1)
@@ -236,7 +244,7 @@ class ExploreConsolidate:
             self.picked_element = np.random.choice(list(remaining))
 
         try:
-            picked_element_index = true_data_id.index(self.picked_element)
+            picked_element_index = self._get_index(true_data_id, orig_n, self.picked_element)
         except:
             #true id of picked element does not exist --> add
             true_data_id.append(self.picked_element)
@@ -245,7 +253,7 @@ class ExploreConsolidate:
             if g_index == -1:
                 self.reset()
                 return self._explore_step(self.n_clusters)
-            X.append(np.array(g_data.df.iloc[g_index].values.tolist()[:-1]))
+            X.append(np.array(g_data.df.iloc[g_index].values.tolist()[:-1]) * np.array(self.node.att_weights))
 
         n_indices = list(range(len(self.neighborhoods)))
         n_hoods_mixed = list(zip(m_neighborhoods, n_indices))
@@ -259,7 +267,8 @@ class ExploreConsolidate:
 
 
     def dist(self, i, S, points):
-        distances = np.array([np.sqrt(((points[i] - points[j]*self.node.att_weights) ** 2).sum()) for j in S])
+        #points are already multiplied with the attribute weights
+        distances = np.array([np.sqrt(((points[i] - points[j]) ** 2).sum()) for j in S])
         return distances.min()
 
 
@@ -0,0 +1,186 @@
+#vectorized assignment step for PCKMeans
+#computes the weighted distance part of the objective for all (row, cluster) pairs at once and only falls back to
+#a sequential pass for rows that are part of must-link/cannot-link constraints
+import operator
+import numpy as np
+import scipy.sparse as sp
+
+#comparison operators that can be used in value restrictions of nodes
+RESTRICTION_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+}
+
+def weighted_distances(X, centers, att_weights, X_weighted=None):
+    """calculate the distance part of the PCKMeans objective for every row and every cluster
+
+    Args:
+        X (np.array): data matrix (n x d)
+        centers (np.array): cluster centers (k x d)
+        att_weights (np.array): attribute weights (d)
+        X_weighted (np.array, optional): X already multiplied with att_weights, only the centers are weighted then
+
+    Returns:
+        np.array: n x k matrix with 1/2 * sum(((x - c) * w)^2)
+    """
+    dist = np.empty((X.shape[0], centers.shape[0]))
+    if X_weighted is not None:
+        for c_i, center in enumerate(centers * att_weights):
+            dist[:, c_i] = 1 / 2 * np.sum((X_weighted - center) ** 2, axis=1)
+        return dist
+    #one column per cluster keeps the temporary at n x d and yields the same values as the per row calculation
+    for c_i, center in enumerate(centers):
+        dist[:, c_i] = 1 / 2 * np.sum(((X - center) * att_weights) ** 2, axis=1)
+    return dist
+
+
+def compile_restrictions(X, hier_rest, n_clusters):
+    """compile the value restrictions of all child nodes into a feasibility mask
+
+    Args:
+        X (np.array): data matrix (n x d)
+        hier_rest (List[List[List]]): restrictions per cluster in format [[attribute index, operator, value], ...]
+        n_clusters (int): number of clusters
+
+    Returns:
+        np.array: boolean n x k matrix, true if row satisfies all restrictions of cluster
+    """
+    feasible = np.ones((X.shape[0], n_clusters), dtype=bool)
+    for c_i in range(n_clusters):
+        for att, op, value in hier_rest[c_i]:
+            if op not in RESTRICTION_OPERATORS:
+                raise ValueError("Unknown restriction operator {}".format(op))
+            feasible[:, c_i] &= RESTRICTION_OPERATORS[op](X[:, int(att)], float(value))
+    return feasible
+
+
+def cluster_sums_counts(X, labels, n_clusters):
+    """sufficient statistics of a clustering result in one pass over the data
+
+    Args:
+        X (np.array): data matrix (n x d)
+        labels (np.array): cluster label per row
+        n_clusters (int): number of clusters
+
+    Returns:
+        Tuple[np.array, np.array]: per cluster sum of rows (k x d) and number of rows (k)
+    """
+    #sparse k x n indicator matrix times X sums up the rows of every cluster
+    indicator = sp.csr_matrix((np.ones(len(labels)), (labels, np.arange(len(labels)))), shape=(n_clusters, len(labels)))
+    sums = np.asarray(indicator @ X, dtype=float)
+    counts = np.bincount(labels, minlength=n_clusters)
+    return sums, counts
+
+
+def centers_from_sums(sums, counts, prev_centers=None):
+    """cluster means from sufficient statistics, empty clusters keep their previous center (or stay at the origin)"""
+    centers = np.zeros(sums.shape) if prev_centers is None else np.array(prev_centers, dtype=float)
+    filled = counts > 0
+    centers[filled] = sums[filled] / counts[filled, None]
+    return centers
+
+
+def constraint_penalty(counts, component, cl_components, w):
+    """penalty per cluster for a row of a must-link component given the label counts of the already assigned rows
+
+    Args:
+        counts (np.array): number of assigned rows per component and cluster
+        component (int): component of the row (the row itself is not part of counts)
+        cl_components (np.array): components cannot-linked with the component of the row
+        w (float): penalty per violated constraint
+
+    Returns:
+        np.array: penalty per cluster
+    """
+    penalty = w * (counts[component].sum() - counts[component])
+    if len(cl_components) > 0:
+        penalty = penalty + w * counts[cl_components].sum(axis=0)
+    return penalty
+
+
+def assign_labels(cost, constraints, w):
+    """assign every row to the cluster with minimal cost
+
+    Unconstrained rows are assigned in one step. Constrained rows are visited in random order and penalized
+    with w for every violated constraint towards already assigned rows (same as the sequential PCKMeans pass),
+    violations are counted with the label counts of the must-link components.
+
+    Args:
+        cost (np.array): n x k matrix of distances (including value penalties)
+        constraints (ConstraintStore): constraints of the rows
+        w (float): penalty per violated constraint
+
+    Returns:
+        np.array: cluster label per row
+    """
+    constrained = constraints.constrained
+    n_clusters = cost.shape[1]
+    #ignore nan costs (e.g. centers of empty clusters) like np.nanargmin does
+    cost = np.where(np.isnan(cost), np.inf, cost)
+    labels = np.argmin(cost, axis=1)
+    if len(constrained) == 0:
+        return labels
+    #constraint partners are constrained rows themselves --> start the sequential pass with all of them unassigned
+    labels[constrained] = -1
+    counts = np.zeros((constraints.n_components, n_clusters))
+    order = np.random.permutation(constrained)
+    for x_i in order:
+        component = constraints.component[x_i]
+        label = np.argmin(cost[x_i] + constraint_penalty(counts, component, constraints.cl_components[component], w))
+        labels[x_i] = label
+        counts[component, label] += 1
+    return labels
+
+
+def constrained_objective(X, centers, labels, att_weights, constraints, w, feasible=None, X_weighted=None):
+    """PCKMeans objective of a result: distances to assigned centers plus penalties for violated constraints
+
+    Args:
+        X (np.array): data matrix (n x d)
+        centers (np.array): cluster centers (k x d)
+        labels (np.array): cluster label per row
+        att_weights (np.array): attribute weights (d)
+        constraints (ConstraintStore): constraints of the rows
+        w (float): penalty per violated constraint
+        feasible (np.array, optional): n x k mask of value restrictions
+        X_weighted (np.array, optional): X already multiplied with att_weights
+
+    Returns:
+        float: objective value (inf if a row violates a value restriction)
+    """
+    if X_weighted is not None:
+        objective = 1 / 2 * np.sum((X_weighted - (centers * att_weights)[labels]) ** 2)
+    else:
+        objective = 1 / 2 * np.sum(((X - centers[labels]) * att_weights) ** 2)
+    if feasible is not None and not feasible[np.arange(len(labels)), labels].all():
+        return np.inf
+    return objective + w * constraints.count_violations(labels, centers.shape[0])
+
+
+def reassign_rows(cost, rows, labels, constraints, w):
+    """re-evaluate single rows against the current labels of all other rows, labels are updated in place
+
+    Args:
+        cost (np.array): len(rows) x k matrix of distances (including value penalties)
+        rows (List[int]): rows to re-evaluate
+        labels (np.array): current cluster label per row
+        constraints (ConstraintStore): constraints of the rows
+        w (float): penalty per violated constraint
+    """
+    n_clusters = cost.shape[1]
+    cost = np.where(np.isnan(cost), np.inf, cost)
+    counts = constraints.label_counts(labels, n_clusters)
+    for pos, x_i in enumerate(rows):
+        component = constraints.component[x_i]
+        if component == -1:
+            labels[x_i] = np.argmin(cost[pos])
+            continue
+        #the row itself does not count towards its own penalty
+        if labels[x_i] != -1:
+            counts[component, labels[x_i]] -= 1
+        labels[x_i] = np.argmin(cost[pos] + constraint_penalty(counts, component, constraints.cl_components[component], w))
+        counts[component, labels[x_i]] += 1
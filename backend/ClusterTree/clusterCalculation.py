@@ -1,30 +1,65 @@
 #original from jaubsvehla for scikit-learn: https://github.com/datamole-ai/active-semi-supervised-clustering/blob/master/active_semi_clustering/semi_supervised/pairwise_constraints/pckmeans.py
 import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from typing import List
 import numpy as np
 import random
-from .pairwise_constraints import preprocess_constraints
-import scipy.sparse as sp
+from .pairwise_constraints import build_constraint_store
+from .assignment import RESTRICTION_OPERATORS, assign_labels, centers_from_sums, cluster_sums_counts, compile_restrictions, constrained_objective, reassign_rows, weighted_distances
 from sklearn.utils.extmath import row_norms, stable_cumsum
 
 # random.seed(8)
 # np.random.seed(8)
 
+#fits running restarts in a process pool: job id -> (model, data matrix), inherited by the forked workers
+_restart_jobs = {}
+
+
+def _run_restart(job_id, seed, centers):
+    """run one restart of PCKMeans in a forked worker on the model and data inherited from the calling process"""
+    model, X = _restart_jobs[job_id]
+    #callbacks belong to the calling process
+    model.callback = None
+    return model._restart(X, seed, centers)
+
+
 class PCKMeans:
     #w is penalty for constraint violation
-    def __init__(self, n_clusters=3, max_iter=100, w=99999999):
+    #n_init restarts are run in n_jobs forked processes (all cores if None, in the calling process if 1) and the result with the lowest objective is kept
+    #algorithm "hamerly" skips rows whose distance bounds prove that their label did not change
+    #iterations stop when centers move less than tol or at most label_tol (fraction) of the labels changed
+    #callback is called with fit_stats_ after every iteration
+    def __init__(self, n_clusters=3, max_iter=100, w=99999999, n_init=1, n_jobs=None, algorithm="lloyd", tol=1e-6, label_tol=0.0, callback=None):
         self.n_clusters = n_clusters
         self.max_iter = max_iter
         self.w = w
+        self.n_init = n_init
+        self.n_jobs = n_jobs
+        self.algorithm = algorithm
+        self.tol = tol
+        self.label_tol = label_tol
+        self.callback = callback
         self.att_weights: np.array = None
         #restrictions set for values in clusters
         self.hier_rest: List[List[List[str]]]
         #rows manually assigned by domain expert
         self.manually_assigned = []
-
-    def init_centers(self, X, ml=[], cl=[], recalc=True):
+        #must-link components and cannot-links between them (ConstraintStore)
+        self.constraints = None
+        #rows that take part in must-link/cannot-link constraints
+        self.constrained = None
+        #n x k mask of rows allowed in clusters by hier_rest, compiled once per fit
+        self.feasible = None
+        #X multiplied with att_weights, handed in from the node cache or calculated once per fit
+        self.X_weighted = None
+
+    def init_centers(self, X, ml=[], cl=[], recalc=True, X_weighted=None, constraints=None):
+        self.X_weighted = X_weighted
         # Preprocess constraints
-        self.ml_graph, self.cl_graph, self.neighborhoods = preprocess_constraints(ml, cl, X.shape[0])
+        self._set_constraints(X, ml, cl, constraints)
 
         # Initialize centroids
         self.cluster_centers = self._initialize_cluster_centers(X, self.neighborhoods, recalc)
@@ -32,33 +67,306 @@ class PCKMeans:
     def refresh_constraints(self):
         pass
 
-    def fit(self, X, y=None, ml=[], cl=[]):
+    def fit(self, X, y=None, ml=[], cl=[], X_weighted=None, constraints=None):
+        start = time.perf_counter()
+        self.X_weighted = X_weighted
         self.refresh_constraints()
         # Preprocess constraints
-        self.ml_graph, self.cl_graph, self.neighborhoods = preprocess_constraints(ml, cl, X.shape[0])
-        ml_graph, cl_graph = self.ml_graph, self.cl_graph
+        self._set_constraints(X, ml, cl, constraints)
+        self.feasible = compile_restrictions(X, self.hier_rest, self.n_clusters)
 
-        # Initialize centroids
-        cluster_centers = self.cluster_centers
+        prev_labels = getattr(self, "labels_", None)
+        if self.n_init > 1:
+            cluster_centers, labels, self.objective_, self.fit_stats_ = self._fit_restarts(X)
+        else:
+            cluster_centers, labels, self.objective_, self.fit_stats_ = self._restart(X, None, self.cluster_centers)
+
+        self.n_changed_ = self._count_changed(prev_labels, labels)
+        self.fit_stats_.update(restarts=self.n_init, warm_start=False, labels_changed_total=self.n_changed_, fit_time=time.perf_counter() - start)
+        self.cluster_centers_, self.labels_ = cluster_centers, labels
+        #per cluster sum and count of the result, usable as sufficient statistics by other consumers
+        self.cluster_sums_, self.cluster_counts_ = cluster_sums_counts(X, labels, self.n_clusters)
+
+        return self
+
+    def refit(self, X, touched_rows, ml=[], cl=[], X_weighted=None, constraints=None):
+        """warm start fit after a small change like a new constraint or a manually assigned row
 
+        Starts from the previous cluster_centers_ and labels_ and first re-evaluates only the touched rows.
+        Iterations over all rows only follow if one of them changed its label.
+        Falls back to a normal fit if the rows or the number of clusters differ from the previous fit.
+
+        Args:
+            X (np.array): data matrix
+            touched_rows (List[int]): rows affected by the change
+            ml (list, optional): must-link constraints
+            cl (list, optional): cannot-link constraints
+            X_weighted (np.array, optional): X multiplied with the attribute weights
+            constraints (ConstraintStore, optional): constraints built from ml and cl, built here if not given
+
+        Returns:
+            PCKMeans: self, n_changed_ holds the number of labels that differ from the previous result
+        """
+        prev_labels = getattr(self, "labels_", None)
+        if prev_labels is None or len(prev_labels) != X.shape[0] or len(self.cluster_centers_) != self.n_clusters:
+            return self.fit(X, ml=ml, cl=cl, X_weighted=X_weighted, constraints=constraints)
+        start = time.perf_counter()
+        self.X_weighted = X_weighted
+        self.refresh_constraints()
+        self._set_constraints(X, ml, cl, constraints)
+        self.feasible = compile_restrictions(X, self.hier_rest, self.n_clusters)
+
+        labels = prev_labels.copy()
+        touched_rows = list(touched_rows)
+        cost = weighted_distances(X[touched_rows], self.cluster_centers_, self.att_weights, self._weighted_data(X)[touched_rows])
+        cost[~self.feasible[touched_rows]] = math.inf
+        reassign_rows(cost, touched_rows, labels, self.constraints, self.w)
+        for cl_i, row_ids in enumerate(self.manually_assigned):
+            for r_id in row_ids:
+                labels[r_id] = cl_i
+
+        if not (labels != prev_labels).any():
+            self.n_changed_ = 0
+            self.fit_stats_ = self._new_fit_stats()
+            self.fit_stats_.update(restarts=1, warm_start=True, labels_changed_total=0, fit_time=time.perf_counter() - start)
+            return self
+
+        cluster_centers, labels, self.fit_stats_ = self._iterate(X, self._get_cluster_centers(X, labels, self.cluster_centers_))
+        self.objective_ = constrained_objective(X, cluster_centers, labels, self.att_weights, self.constraints, self.w, self.feasible, self._weighted_data(X))
+        self._finish_fit_stats(self.fit_stats_, self.objective_)
+        self.n_changed_ = self._count_changed(prev_labels, labels)
+        self.fit_stats_.update(restarts=1, warm_start=True, labels_changed_total=self.n_changed_, fit_time=time.perf_counter() - start)
+        self.cluster_centers_, self.labels_ = cluster_centers, labels
+        #per cluster sum and count of the result, usable as sufficient statistics by other consumers
+        self.cluster_sums_, self.cluster_counts_ = cluster_sums_counts(X, labels, self.n_clusters)
+
+        return self
+
+    def _weighted_data(self, X):
+        """X multiplied with the attribute weights, calculated once if it was not handed in"""
+        if self.X_weighted is None or self.X_weighted.shape != X.shape:
+            self.X_weighted = np.asarray(X, dtype=float) * self.att_weights
+        return self.X_weighted
+
+    def _set_constraints(self, X, ml, cl, constraints=None):
+        """use the given constraint store or build one from must-link and cannot-link lists"""
+        self.constraints = constraints if constraints is not None else build_constraint_store(ml, cl, X.shape[0])
+        self.constrained = self.constraints.constrained
+        self.neighborhoods = self.constraints.get_neighborhoods()
+
+    def _count_changed(self, prev_labels, labels):
+        """number of rows whose label differs from the previous result (all rows if there is no comparable result)"""
+        if prev_labels is None or len(prev_labels) != len(labels):
+            return len(labels)
+        return int(np.sum(prev_labels != labels))
+
+    def _new_fit_stats(self):
+        """telemetry of one fit: objective (per iteration if a callback is set, otherwise of the result) and changed labels
+        per iteration, time spent in assignment and center update"""
+        return {"iterations": 0, "converged": False, "objective": [], "labels_changed": [], "assign_time": 0.0, "update_time": 0.0}
+
+    def _record_iteration(self, stats, objective, labels_changed, assign_time, update_time):
+        """add one iteration to the fit stats and inform the callback, objective is None if it is not tracked per iteration"""
+        stats["iterations"] += 1
+        if objective is not None:
+            stats["objective"].append(float(objective))
+        stats["labels_changed"].append(labels_changed)
+        stats["assign_time"] += assign_time
+        stats["update_time"] += update_time
+        if self.callback is not None:
+            self.callback(stats)
+
+    def _iteration_objective(self, X, cluster_centers, labels):
+        """objective of an iteration, the full pass over the data is only spent if a callback follows the fit"""
+        if self.callback is None:
+            return None
+        return constrained_objective(X, cluster_centers, labels, self.att_weights, self.constraints, self.w, self.feasible, self._weighted_data(X))
+
+    def _finish_fit_stats(self, stats, objective):
+        """add the objective of the result if it was not tracked per iteration"""
+        if len(stats["objective"]) < stats["iterations"]:
+            stats["objective"].append(float(objective))
+
+    def _labels_converged(self, labels, prev_labels):
+        """true if at most label_tol (fraction) of the labels changed since the previous iteration"""
+        return prev_labels is not None and np.sum(labels != prev_labels) <= self.label_tol * len(labels)
+
+    def _iterate(self, X, cluster_centers):
+        """alternate assignment and center estimation until convergence
+
+        Returns:
+            Tuple[np.array, np.array, dict]: cluster centers, labels and fit stats
+        """
+        if self.algorithm == "hamerly":
+            return self._iterate_hamerly(X, cluster_centers)
+        stats = self._new_fit_stats()
+        labels = None
         # Repeat until convergence
         for iteration in range(self.max_iter):
             # Assign clusters
-            labels = self._assign_clusters(X, cluster_centers, ml_graph, cl_graph, self.w)
+            prev_labels = labels
+            assign_start = time.perf_counter()
+            labels = self._assign_clusters(X, cluster_centers, self.constraints, self.w)
 
             # Estimate means
+            update_start = time.perf_counter()
             prev_cluster_centers = cluster_centers
-            cluster_centers = self._get_cluster_centers(X, labels)
+            cluster_centers = self._get_cluster_centers(X, labels, prev_cluster_centers)
+            update_end = time.perf_counter()
+
+            objective = self._iteration_objective(X, cluster_centers, labels)
+            labels_changed = self._count_changed(prev_labels, labels)
+            self._record_iteration(stats, objective, labels_changed, update_start - assign_start, update_end - update_start)
 
             # Check for convergence
             difference = (prev_cluster_centers - cluster_centers)
-            converged = np.allclose(difference, np.zeros(cluster_centers.shape), atol=1e-6, rtol=0)
+            converged = np.allclose(difference, np.zeros(cluster_centers.shape), atol=self.tol, rtol=0) or self._labels_converged(labels, prev_labels)
 
-            if converged: break
+            if converged:
+                stats["converged"] = True
+                break
 
-        self.cluster_centers_, self.labels_ = cluster_centers, labels
+        return cluster_centers, labels, stats
 
-        return self
+    def _iterate_hamerly(self, X, cluster_centers):
+        """same iterations as _iterate but with Hamerly's triangle inequality bounds
+
+        Every row keeps an upper bound on the weighted distance to its own center and a lower bound on the distance
+        to every other center. Rows whose upper bound stays below the lower bound (or half the distance from their center
+        to the closest other center) keep their label without calculating distances.
+        Rows with constraints or manual assignments are always re-evaluated. Value restrictions are fixed during a fit,
+        infeasible clusters are excluded from the exact bounds which keeps the bounds valid for restricted rows.
+        """
+        n = X.shape[0]
+        X_weighted = self._weighted_data(X)
+        all_rows = np.arange(n)
+        manual = np.array([r_id for row_ids in self.manually_assigned for r_id in row_ids], dtype=int)
+        special = np.concatenate([self.constrained, np.setdiff1d(manual, self.constrained)]).astype(int)
+        bounded = np.ones(n, dtype=bool)
+        bounded[special] = False
+
+        stats = self._new_fit_stats()
+        upper = np.zeros(n)
+        lower = np.zeros(n)
+
+        def evaluate(rows, centers):
+            #cost of rows for all clusters, only the weighted data is needed
+            X_rows = X_weighted if rows is all_rows else X_weighted[rows]
+            cost = weighted_distances(X_rows, centers, self.att_weights, X_rows)
+            cost[~(self.feasible if rows is all_rows else self.feasible[rows])] = math.inf
+            return cost
+
+        def set_bounds(rows, cost, row_labels):
+            #exact bounds of fully evaluated rows
+            dist = np.sqrt(2 * np.where(np.isnan(cost), np.inf, cost))
+            upper[rows] = dist[np.arange(len(rows)), row_labels]
+            dist[np.arange(len(rows)), row_labels] = np.inf
+            lower[rows] = dist.min(axis=1) if self.n_clusters > 1 else np.inf
+
+        def reassign(rows, centers):
+            #full evaluation of rows (constrained ones first)
+            cost = evaluate(rows, centers)
+            row_labels = assign_labels(cost, self.constraints.subset(rows), self.w)
+            labels[rows] = row_labels
+            set_bounds(rows, cost, row_labels)
+
+        #first assignment of all rows, its distances seed the bounds
+        assign_start = time.perf_counter()
+        cost = evaluate(all_rows, cluster_centers)
+        labels = assign_labels(cost, self.constraints, self.w)
+        for cl, row_ids in enumerate(self.manually_assigned):
+            for r_id in row_ids:
+                labels[r_id] = cl
+        set_bounds(all_rows, cost, labels)
+        del cost
+        assign_time = time.perf_counter() - assign_start
+        prev_labels = None
+
+        for iteration in range(self.max_iter):
+            # Estimate means
+            update_start = time.perf_counter()
+            prev_cluster_centers = cluster_centers
+            cluster_centers = self._get_cluster_centers(X, labels, prev_cluster_centers)
+            update_time = time.perf_counter() - update_start
+
+            objective = self._iteration_objective(X, cluster_centers, labels)
+            self._record_iteration(stats, objective, self._count_changed(prev_labels, labels), assign_time, update_time)
+
+            # Check for convergence
+            difference = (prev_cluster_centers - cluster_centers)
+            converged = np.allclose(difference, np.zeros(cluster_centers.shape), atol=self.tol, rtol=0) or self._labels_converged(labels, prev_labels)
+
+            if converged:
+                stats["converged"] = True
+                break
+            if iteration == self.max_iter - 1: break
+
+            assign_start = time.perf_counter()
+            prev_labels = labels.copy()
+            #center movement loosens the bounds
+            delta = np.sqrt(np.sum(((cluster_centers - prev_cluster_centers) * self.att_weights) ** 2, axis=1))
+            delta = np.where(np.isnan(delta), np.inf, delta)
+            upper += delta[labels]
+            order = np.argsort(delta)
+            second_delta = delta[order[-2]] if self.n_clusters > 1 else 0
+            lower -= np.where(labels == order[-1], second_delta, delta[order[-1]])
+            #half distance to the closest other center
+            center_dist = np.sqrt(2 * weighted_distances(cluster_centers, cluster_centers, self.att_weights))
+            center_dist[np.isnan(center_dist)] = np.inf
+            np.fill_diagonal(center_dist, np.inf)
+            bound = np.maximum(0.5 * center_dist.min(axis=1)[labels], lower)
+
+            #tighten upper bound of rows that might have changed, then fully evaluate those that still might
+            candidates = np.flatnonzero(bounded & (upper > bound))
+            upper[candidates] = np.sqrt(np.sum((X_weighted[candidates] - (cluster_centers * self.att_weights)[labels[candidates]]) ** 2, axis=1))
+            candidates = candidates[upper[candidates] > bound[candidates]]
+            reassign(np.concatenate([special, candidates]), cluster_centers)
+
+            #respect manually assigned nodes --> overwrite result before next centroid estimation
+            for cl, row_ids in enumerate(self.manually_assigned):
+                for r_id in row_ids:
+                    labels[r_id] = cl
+            assign_time = time.perf_counter() - assign_start
+
+        return cluster_centers, labels, stats
+
+    def _restart(self, X, seed=None, centers=None):
+        """run one seeded restart, new k-means++ centers are drawn if no centers are given
+
+        Returns:
+            Tuple[np.array, np.array, float, dict]: cluster centers, labels, constrained objective and fit stats
+        """
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+        if centers is None:
+            centers = self.kmeans_plus_plus_init(X, self.n_clusters)
+        cluster_centers, labels, stats = self._iterate(X, centers)
+        objective = constrained_objective(X, cluster_centers, labels, self.att_weights, self.constraints, self.w, self.feasible, self._weighted_data(X))
+        self._finish_fit_stats(stats, objective)
+        return cluster_centers, labels, objective, stats
+
+    def _fit_restarts(self, X):
+        """run n_init restarts (in a pool of n_jobs forked processes that inherit model and X) and keep the one with the
+        lowest objective"""
+        seeds = [int(seed) for seed in np.random.randint(0, 2**31 - 1, size=self.n_init)]
+        #first restart continues from the current centers (keeps warm start from init_centers)
+        starts = [self.cluster_centers] + [None] * (self.n_init - 1)
+        n_jobs = min(self.n_init, self.n_jobs or os.cpu_count() or 1)
+        if n_jobs <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+            results = [self._restart(X, seed, centers) for seed, centers in zip(seeds, starts)]
+        else:
+            #only seeds and start centers are sent to the workers, model state and X are shared copy on write
+            job_id = id(self)
+            _restart_jobs[job_id] = (self, X)
+            try:
+                #fork does not re-import the main module (mqtt backend) in the workers
+                with ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context("fork")) as pool:
+                    futures = [pool.submit(_run_restart, job_id, seed, centers) for seed, centers in zip(seeds, starts)]
+                    results = [future.result() for future in futures]
+            finally:
+                del _restart_jobs[job_id]
+        return min(results, key=lambda result: result[2])
 
     def _initialize_cluster_centers(self, X, neighborhoods, recalc=True):
         """_summary_
@@ -91,12 +399,12 @@ class PCKMeans:
         if recalc:
             cluster_centers = self.kmeans_plus_plus_init(X, self.n_clusters)
         else:
-            cluster_centers = self.kmeans_plus_plus_init(X, self.n_clusters, self.cluster_centers)
+            cluster_centers = self.kmeans_plus_plus_init(X, self.n_clusters, prev_cent=self.cluster_centers)
 
         return cluster_centers
 
     def _objective_function(self, X, x_i, centroids, c_i, labels, ml_graph, cl_graph, w):
-        distance = 1 / 2 * np.sum(((X[x_i] - centroids[c_i])*self.att_weights) ** 2)
+        distance = 1 / 2 * np.sum((self._weighted_data(X)[x_i] - centroids[c_i]*self.att_weights) ** 2)
 
         ml_penalty = 0
         for y_i in ml_graph[x_i]:
@@ -115,12 +423,29 @@ class PCKMeans:
 
     def _calc_value_penalty(self, x, c_i):
         for val_rest in self.hier_rest[c_i]:
-            ev_string = str(x[val_rest[0]]) + val_rest[1] + str(val_rest[2])
-            if not eval(ev_string):
+            if not RESTRICTION_OPERATORS[val_rest[1]](x[int(val_rest[0])], float(val_rest[2])):
                 return math.inf
         return 0
 
-    def _assign_clusters(self, X, cluster_centers, ml_graph, cl_graph, w):
+    def _assign_clusters(self, X, cluster_centers, constraints, w):
+        feasible = self.feasible
+        if feasible is None or feasible.shape != (X.shape[0], self.n_clusters):
+            feasible = compile_restrictions(X, self.hier_rest, self.n_clusters)
+        cost = weighted_distances(X, cluster_centers, self.att_weights, self._weighted_data(X))
+        #rows violating value restrictions can not be assigned to the cluster
+        cost[~feasible] = math.inf
+        labels = assign_labels(cost, constraints, w)
+
+        #respect manually assigned nodes --> overwrite result before next centroid estimation
+        for cl, row_ids in enumerate(self.manually_assigned):
+            for r_id in row_ids:
+                labels[r_id] = cl
+
+        return labels
+
+    def _assign_clusters_sequential(self, X, cluster_centers, constraints, w):
+        """original row by row assignment, kept as reference for the vectorized assignment"""
+        ml_graph, cl_graph = constraints.to_graphs()
         labels = np.full(X.shape[0], fill_value=-1)
 
         index = list(range(X.shape[0]))
@@ -146,8 +471,10 @@ class PCKMeans:
 
         return labels
 
-    def _get_cluster_centers(self, X, labels):
-        return np.array([X[labels == i].mean(axis=0) for i in range(self.n_clusters)])
+    def _get_cluster_centers(self, X, labels, prev_centers=None):
+        """means of the clusters in one pass over X, empty clusters keep their previous center"""
+        sums, counts = cluster_sums_counts(X, labels, self.n_clusters)
+        return centers_from_sums(sums, counts, prev_centers)
 
     #kmeans++ centroid initialization taken from kdnuggets with minor adjustment in distance function and param to remember initial centroids from previous clusters to take attribute weights into account
     #original reference: https://www.kdnuggets.com/2020/06/centroid-initialization-k-means-clustering.html
@@ -168,24 +495,99 @@ class PCKMeans:
         """
 
         np.random.seed(random.randrange(0, 10000))
+        #float data prevents overflow of squared distances for integer columns
+        ds = np.asarray(ds, dtype=float)
+        ds_weighted = self._weighted_data(ds)
         centroids = [ds[0]]
-        if prev_cent != None:
-            centroids = prev_cent
+        if prev_cent is not None:
+            centroids = list(prev_cent)
+
+        #running minimal weighted squared distance of every point to the chosen centroids
+        min_dist = np.full(ds.shape[0], np.inf)
+        for c in centroids:
+            min_dist = np.minimum(min_dist, np.sum((ds_weighted - c * self.att_weights) ** 2, axis=1))
 
         for _ in range(len(centroids), k):
-            dist_sq = np.array([min([np.inner((c-x)*self.att_weights,(c-x)*self.att_weights) for c in centroids]) for x in ds])
-            #fix for numpy overflow of numbers (caused by C types)
-            dist_sum = sum(map(lambda x: float(x), list(dist_sq)))
-            probs = [val/dist_sum for val in dist_sq]
-            probs = np.array(probs)
-            cumulative_probs = probs.cumsum()
-            r = np.random.rand()
-            
-            for j, p in enumerate(cumulative_probs):
-                if r < p:
-                    i = j
-                    break
-            
+            cumulative_dist = np.cumsum(min_dist)
+            dist_sum = cumulative_dist[-1]
+            if dist_sum > 0:
+                #first point whose cumulative probability exceeds r
+                i = min(np.searchsorted(cumulative_dist, np.random.rand() * dist_sum, side="right"), len(ds) - 1)
+            else:
+                #all points coincide with existing centroids
+                i = np.random.randint(len(ds))
             centroids.append(ds[i])
+            #only the newest centroid can lower the minimal distances
+            min_dist = np.minimum(min_dist, np.sum((ds_weighted - ds_weighted[i]) ** 2, axis=1))
 
         return np.array(centroids)
+
+
+class MiniBatchPCKMeans(PCKMeans):
+    """PCKMeans variant for large nodes: centers are updated from random batches using per center counts,
+    labels_ are produced by one assignment of the full data at the end.
+    Constrained and manually assigned rows are part of every batch so constraints and restrictions stay respected.
+    Batches stop once the weighted center shift falls below center_tol times the mean weighted variance of the data
+    (instead of tol) or at most label_tol (fraction) of the batch rows changed their label since they were last sampled."""
+
+    def __init__(self, n_clusters=3, max_iter=100, w=99999999, n_init=1, n_jobs=None, batch_size=4096, center_tol=1e-4, tol=1e-6, label_tol=0.0, callback=None):
+        super().__init__(n_clusters, max_iter, w, n_init, n_jobs, tol=tol, label_tol=label_tol, callback=callback)
+        self.batch_size = batch_size
+        self.center_tol = center_tol
+
+    def _iterate(self, X, cluster_centers):
+        cluster_centers = np.array(cluster_centers, dtype=float)
+        X_weighted = self._weighted_data(X)
+        #rows present in every batch: constrained rows first, then manually assigned ones
+        manual = [(cl, r_id) for cl, row_ids in enumerate(self.manually_assigned) for r_id in row_ids]
+        special = np.concatenate([self.constrained, np.setdiff1d([r_id for cl, r_id in manual], self.constrained)]).astype(int)
+        candidates = np.setdiff1d(np.arange(X.shape[0]), special)
+        #special rows keep their position in every batch
+        position = {r_id: pos for pos, r_id in enumerate(special)}
+        manual_pos = [(cl, position[r_id]) for cl, r_id in manual]
+        counts = np.zeros(self.n_clusters)
+        #label of every row in the last batch it was part of (-1 if it was not sampled yet)
+        row_labels = np.full(X.shape[0], -1)
+        tol = None
+        stats = self._new_fit_stats()
+
+        for iteration in range(self.max_iter):
+            assign_start = time.perf_counter()
+            sample_size = min(self.batch_size, len(candidates))
+            batch = np.concatenate([special, np.random.choice(candidates, sample_size, replace=False)])
+            X_batch = X[batch]
+            if tol is None:
+                tol = self.center_tol * np.mean(np.var(X_weighted[batch], axis=0))
+
+            #assign batch
+            cost = weighted_distances(X_batch, cluster_centers, self.att_weights, X_weighted[batch])
+            cost[~self.feasible[batch]] = math.inf
+            labels = assign_labels(cost, self.constraints.subset(batch), self.w)
+            for cl, pos in manual_pos:
+                labels[pos] = cl
+
+            #move centers towards the batch mean weighted by the number of points seen so far
+            update_start = time.perf_counter()
+            prev_cluster_centers = cluster_centers
+            batch_sums, batch_counts = cluster_sums_counts(X_batch, labels, self.n_clusters)
+            counts = counts + batch_counts
+            moved = batch_counts > 0
+            cluster_centers = cluster_centers.copy()
+            cluster_centers[moved] += (batch_sums[moved] - batch_counts[moved, None] * cluster_centers[moved]) / counts[moved, None]
+
+            #objective and changed labels of the batch, rows sampled for the first time count as changed
+            batch_objective = np.sum(cost[np.arange(len(batch)), labels])
+            labels_changed = int(np.sum(row_labels[batch] != labels))
+            row_labels[batch] = labels
+            self._record_iteration(stats, batch_objective, labels_changed, update_start - assign_start, time.perf_counter() - update_start)
+
+            # Check for convergence
+            if np.sum(((cluster_centers - prev_cluster_centers) * self.att_weights) ** 2) <= tol or labels_changed <= self.label_tol * len(batch):
+                stats["converged"] = True
+                break
+
+        #final assignment of all rows
+        assign_start = time.perf_counter()
+        labels = self._assign_clusters(X, cluster_centers, self.constraints, self.w)
+        stats["assign_time"] += time.perf_counter() - assign_start
+        return cluster_centers, labels, stats
@@ -0,0 +1,131 @@
+#undo/redo history of a tree
+#a version only holds the states of the nodes an operation changed, a state only references the node's objects
+#(model with labels and centers, data view, node info, ...) so unchanged objects are shared between versions.
+#recalculation never modifies these objects in place (models are copied before a fit, see TreeNode.fit_node),
+#undo and redo only swap the references of the changed nodes back. stored states do not keep caches: the weighted
+#matrix of the model and frames/matrices of the data view are dropped and rebuilt on access once a state is current again
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+#attributes of a node that make up its state in a version
+NODE_STATE_FIELDS = ("data", "clusterObj", "fit_stats", "q_indikators", "att_weights", "hier_restrictions", "assigned_rows",
+                     "dirty", "input_fingerprint", "partition_version", "analysis", "analysis_key")
+
+
+def get_node_version_state(node) -> Dict:
+    return {field: getattr(node, field) for field in NODE_STATE_FIELDS}
+
+
+def _state_changed(before: Dict, after: Dict) -> bool:
+    return any(before[field] is not after[field] and before[field] != after[field] for field in NODE_STATE_FIELDS)
+
+
+def _drop_caches(node, state: Dict):
+    """drop the caches of the objects of a state that are not used by the node anymore"""
+    if state["clusterObj"] is not None and state["clusterObj"] is not node.clusterObj:
+        state["clusterObj"].X_weighted = None
+    if state["data"] is not None and state["data"] is not node.data:
+        state["data"].drop_caches()
+
+
+class TreeHistory:
+    """Versioned history of the operations applied to a tree
+
+    Only operations run inside record are versioned, operations that change the structure of the tree or modify node
+    state in place (adding/removing nodes, active learning answers, re cluster, new data) clear the history.
+    """
+
+    def __init__(self, tree, max_versions=50):
+        self.tree = tree
+        #oldest versions are dropped first
+        self.max_versions = max_versions
+        #versions as (operation name, [(node, state before, state after), ...]) with parents first
+        self.undo_stack: List[Tuple[str, List]] = []
+        self.redo_stack: List[Tuple[str, List]] = []
+        #node states before the operation that is currently recorded
+        self.pending: Dict = None
+
+    @contextmanager
+    def record(self, operation: str):
+        """record the changes of an operation (including its recalculation) as a new version
+
+        Args:
+            operation (str): name of the operation
+        """
+        self.pending = {node.id: (node, get_node_version_state(node)) for node in self.tree.iterNodes()}
+        try:
+            yield
+        except Exception:
+            self.pending = None
+            raise
+        if self.pending is None:
+            #operation cleared the history
+            return
+        changes = []
+        for node in self.tree.iterNodes():
+            if node.id not in self.pending or self.pending[node.id][0] is not node:
+                continue
+            before = self.pending[node.id][1]
+            after = get_node_version_state(node)
+            if _state_changed(before, after):
+                _drop_caches(node, before)
+                changes.append((node, before, after))
+        self.pending = None
+        if len(changes) == 0:
+            return
+        self.undo_stack.append((operation, changes))
+        del self.undo_stack[:-self.max_versions]
+        self.redo_stack = []
+
+    def clear(self):
+        """drop all versions, e.g. after the structure of the tree changed"""
+        self.undo_stack = []
+        self.redo_stack = []
+        self.pending = None
+
+    def can_undo(self) -> bool:
+        return len(self.undo_stack) > 0
+
+    def can_redo(self) -> bool:
+        return len(self.redo_stack) > 0
+
+    def undo(self) -> str:
+        """restore the node states before the last recorded operation without recalculating
+
+        Returns:
+            str: name of the reverted operation, None if there is nothing to undo
+        """
+        if not self.can_undo():
+            return None
+        operation, changes = self.undo_stack.pop()
+        self._apply(changes, 1, 2)
+        self.redo_stack.append((operation, changes))
+        return operation
+
+    def redo(self) -> str:
+        """restore the node states after the last reverted operation without recalculating
+
+        Returns:
+            str: name of the restored operation, None if there is nothing to redo
+        """
+        if not self.can_redo():
+            return None
+        operation, changes = self.redo_stack.pop()
+        self._apply(changes, 2, 1)
+        self.undo_stack.append((operation, changes))
+        return operation
+
+    def _apply(self, changes: List, state_index: int, replaced_index: int):
+        for change in changes:
+            node = change[0]
+            for field, value in change[state_index].items():
+                setattr(node, field, value)
+            _drop_caches(node, change[replaced_index])
+        #node infos of the changed nodes, parents first like after a calculation
+        for change in changes:
+            change[0].publish_analysis()
+
+    def get_status(self) -> Dict:
+        """operations that can be reverted and restored, most recent last"""
+        return {"undo": [operation for operation, _ in self.undo_stack],
+                "redo": [operation for operation, _ in self.redo_stack]}
@@ -1,5 +1,7 @@
 # Version from https://github.com/datamole-ai/active-semi-supervised-clustering/blob/master/active_semi_clustering/semi_supervised/pairwise_constraints/constraints.py
 #Originally taken from https://github.com/Behrouz-Babaki/COP-Kmeans/blob/master/copkmeans/cop_kmeans.py
+import numpy as np
+
 def preprocess_constraints(ml, cl, n):
     "Create a graph of constraints for both must- and cannot-links"
 
@@ -59,4 +61,244 @@ def preprocess_constraints(ml, cl, n):
             if j != i and j in cl_graph[i]:
                 raise Exception('Inconsistent constraints between {} and {}'.format(i, j))
 
-    return ml_graph, cl_graph, neighborhoods
\ No newline at end of file
+    return ml_graph, cl_graph, neighborhoods
+
+
+class ConstraintStore:
+    """Must-link components and cannot-links between components
+
+    Every row that takes part in a constraint belongs to exactly one component (rows without constraints have -1),
+    rows of a component are must-linked with each other. Cannot-links are stored once per pair of components,
+    which is the transitive closure preprocess_constraints materializes per pair of rows.
+    """
+
+    def __init__(self, component, cl_pairs):
+        #component id per row (n), -1 if row has no constraint
+        self.component = component
+        #unique cannot-linked component pairs (m x 2), first id smaller than second
+        self.cl_pairs = cl_pairs
+        #rows with constraints in ascending order
+        self.constrained = np.flatnonzero(component != -1)
+        self.n_components = int(component.max()) + 1 if len(self.constrained) > 0 else 0
+        #cannot-linked components per component
+        self.cl_components = [[] for _ in range(self.n_components)]
+        for a, b in cl_pairs:
+            self.cl_components[a].append(b)
+            self.cl_components[b].append(a)
+        self.cl_components = [np.array(comps, dtype=int) for comps in self.cl_components]
+
+    def subset(self, rows):
+        """store for a subset of rows, rows are addressed by their position in the subset"""
+        return ConstraintStore(self.component[rows], self.cl_pairs)
+
+    def get_members(self):
+        """rows of every component"""
+        rows = self.constrained
+        order = np.argsort(self.component[rows], kind="stable")
+        sizes = np.bincount(self.component[rows], minlength=self.n_components)
+        return np.split(rows[order], np.cumsum(sizes)[:-1]) if self.n_components > 0 else []
+
+    def get_neighborhoods(self):
+        """must-link components with more than one row"""
+        return [members.tolist() for members in self.get_members() if len(members) > 1]
+
+    def label_counts(self, labels, n_clusters):
+        """number of rows per component and cluster, unassigned rows (-1) are ignored"""
+        counts = np.zeros((self.n_components, n_clusters))
+        rows = self.constrained[labels[self.constrained] != -1]
+        np.add.at(counts, (self.component[rows], labels[rows]), 1)
+        return counts
+
+    def count_violations(self, labels, n_clusters):
+        """number of violated must-link and cannot-link pairs of rows"""
+        counts = self.label_counts(labels, n_clusters)
+        #pairs within a component that are not in the same cluster
+        ml_violations = np.sum(counts.sum(axis=1) ** 2 - np.sum(counts ** 2, axis=1)) / 2
+        #pairs of cannot-linked components that are in the same cluster
+        cl_violations = np.sum(counts[self.cl_pairs[:, 0]] * counts[self.cl_pairs[:, 1]]) if len(self.cl_pairs) > 0 else 0
+        return ml_violations + cl_violations
+
+    def to_graphs(self):
+        """adjacency lists per row in the format of preprocess_constraints (for the sequential reference implementation)"""
+        n = len(self.component)
+        ml_graph = {i: set() for i in range(n)}
+        cl_graph = {i: set() for i in range(n)}
+        members = self.get_members()
+        for rows in members:
+            for x in rows:
+                ml_graph[x].update(rows.tolist())
+                ml_graph[x].discard(x)
+        for a, b in self.cl_pairs:
+            for x in members[a]:
+                cl_graph[x].update(members[b].tolist())
+            for y in members[b]:
+                cl_graph[y].update(members[a].tolist())
+        return ml_graph, cl_graph
+
+
+def build_constraint_store(ml, cl, n):
+    """Create a ConstraintStore for n rows, must-link components are merged with union-find
+
+    Args:
+        ml (List[Tuple[int, int]]): must-link constraints between row positions
+        cl (List[Tuple[int, int]]): cannot-link constraints between row positions
+        n (int): number of rows
+
+    Raises:
+        Exception: if a cannot-link connects two rows of the same must-link component
+
+    Returns:
+        ConstraintStore: constraint store
+    """
+    #parent and size only for rows with constraints, unknown rows are their own root
+    parent = {}
+    size = {}
+
+    def find(i):
+        root = i
+        while parent.get(root, root) != root:
+            root = parent[root]
+        #path compression
+        while i != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    for (i, j) in ml:
+        root_i, root_j = find(i), find(j)
+        if root_i == root_j:
+            continue
+        #union by size keeps the trees flat
+        if size.get(root_i, 1) < size.get(root_j, 1):
+            root_i, root_j = root_j, root_i
+        parent[root_j] = root_i
+        size[root_i] = size.get(root_i, 1) + size.get(root_j, 1)
+
+    component = np.full(n, -1, dtype=int)
+    rows = np.unique(np.array([r for const in list(ml) + list(cl) for r in const], dtype=int))
+    if len(rows) > 0:
+        roots = np.array([find(r) for r in rows.tolist()])
+        _, component[rows] = np.unique(roots, return_inverse=True)
+
+    cl_pairs = set()
+    for (i, j) in cl:
+        a, b = component[i], component[j]
+        if a == b:
+            raise Exception('Inconsistent constraints between {} and {}'.format(i, j))
+        cl_pairs.add((min(a, b), max(a, b)))
+    cl_pairs = np.array(sorted(cl_pairs), dtype=int).reshape(-1, 2)
+
+    return ConstraintStore(component, cl_pairs)
+
+
+class IncrementalConstraintStore:
+    """Must-link components and cannot-links between components over unique row ids, updated with every answer
+
+    Components are kept in a union-find structure, cannot-links as adjacency sets between component roots.
+    """
+
+    def __init__(self):
+        #union-find parent and component size per row id
+        self.parent = {}
+        self.size = {}
+        #cannot-linked component roots per component root
+        self.cl_roots = {}
+
+    def find(self, row_id):
+        """root of the component of a row id"""
+        root = row_id
+        while self.parent.get(root, root) != root:
+            root = self.parent[root]
+        #path compression
+        while row_id != root:
+            self.parent[row_id], row_id = root, self.parent[row_id]
+        return root
+
+    def _add_row(self, row_id):
+        if row_id not in self.parent:
+            self.parent[row_id] = row_id
+            self.size[row_id] = 1
+            self.cl_roots[row_id] = set()
+
+    def add_must_link(self, i, j) -> bool:
+        """merge the components of i and j, returns true if they were not linked before"""
+        self._add_row(i)
+        self._add_row(j)
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            return False
+        if root_j in self.cl_roots[root_i]:
+            raise Exception('Inconsistent constraints between {} and {}'.format(i, j))
+        #union by size, cannot-links of the merged component move to the new root
+        if self.size[root_i] < self.size[root_j]:
+            root_i, root_j = root_j, root_i
+        self.parent[root_j] = root_i
+        self.size[root_i] += self.size.pop(root_j)
+        for other in self.cl_roots.pop(root_j):
+            self.cl_roots[other].discard(root_j)
+            self.cl_roots[other].add(root_i)
+            self.cl_roots[root_i].add(other)
+        return True
+
+    def add_cannot_link(self, i, j) -> bool:
+        """cannot-link the components of i and j, returns true if they were not cannot-linked before"""
+        self._add_row(i)
+        self._add_row(j)
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            raise Exception('Inconsistent constraints between {} and {}'.format(i, j))
+        if root_j in self.cl_roots[root_i]:
+            return False
+        self.cl_roots[root_i].add(root_j)
+        self.cl_roots[root_j].add(root_i)
+        return True
+
+    def add_neighborhoods(self, neighborhoods):
+        """add the neighborhoods of the active learner: must-links within and cannot-links between neighborhoods
+
+        Args:
+            neighborhoods (List[List[int]]): row ids known to belong together, different neighborhoods belong to different clusters
+
+        Returns:
+            set: row ids of all components whose constraints changed
+        """
+        changed = set()
+        for neighborhood in neighborhoods:
+            for row_id in neighborhood[1:]:
+                if self.add_must_link(int(neighborhood[0]), int(row_id)):
+                    changed.add(int(row_id))
+        #one representative per neighborhood is enough, cannot-links hold between components
+        representatives = [int(neighborhood[0]) for neighborhood in neighborhoods if len(neighborhood) > 0]
+        for index, rep_i in enumerate(representatives):
+            for rep_j in representatives[index + 1:]:
+                if self.add_cannot_link(rep_i, rep_j):
+                    changed.update((rep_i, rep_j))
+        changed_roots = {self.find(row_id) for row_id in changed}
+        return {row_id for row_id in self.parent if self.find(row_id) in changed_roots}
+
+    def get_applicable_constraints(self, get_positions):
+        """constraints between rows of a node, translated to positions
+
+        Args:
+            get_positions (Callable): maps an array of unique row ids to positions in the node (-1 if not present)
+
+        Returns:
+            Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]: must-links from every present row to the first present
+                row of its component and cannot-links between those first rows
+        """
+        known = np.fromiter(self.parent.keys(), dtype=int, count=len(self.parent))
+        positions = get_positions(known)
+        present = positions != -1
+        first = {}
+        ml = []
+        for row_id, pos in zip(known[present].tolist(), positions[present].tolist()):
+            root = self.find(row_id)
+            if root in first:
+                ml.append((first[root], pos))
+            else:
+                first[root] = pos
+        cl = [(first[root], first[other]) for root in first for other in self.cl_roots[root] if other in first and root < other]
+        return ml, cl
+
+    def __len__(self):
+        """number of rows with constraints"""
+        return len(self.parent)
@@ -0,0 +1,200 @@
+#binary snapshot of a tree session
+#one uncompressed .npz file: numeric state (labels, centers, child rows, constraints) as raw arrays and everything else
+#(structure, names, restrictions, active learning state, node infos) as json in the "meta" entry
+#restoring rebuilds nodes, data views and pckmeans models without calculating anything
+import json
+import os
+from typing import Dict
+
+import numpy as np
+
+from utils import get_source_path
+from .Tree import Tree
+from .TreeNode import TreeNode
+from .clusterCalculation import MiniBatchPCKMeans, PCKMeans
+
+SNAPSHOT_VERSION = 1
+#pckmeans attributes that are rebuilt on the next fit or belong to the calling process
+_MODEL_SKIPPED = ("callback", "X_weighted", "constraints")
+_MODEL_CLASSES = {"PCKMeans": PCKMeans, "MiniBatchPCKMeans": MiniBatchPCKMeans}
+_TREE_SETTINGS = ("n_init", "recluster_n_init", "restart_jobs", "subtree_jobs", "subtree_min_rows", "minibatch_threshold",
+                  "hamerly_min_clusters")
+
+
+def _to_json(value):
+    """json conversion of numpy values and sets"""
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, (np.ndarray, set)):
+        return [_to_json(item) for item in value]
+    raise TypeError("Value of type {} can not be stored in a snapshot".format(type(value).__name__))
+
+
+def _get_dataset_stat(data_source):
+    #same file the dataset registry and the dataset cache are keyed on
+    stat = os.stat(get_source_path(data_source))
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _save_model(model, prefix, arrays) -> Dict:
+    meta = {"class": type(model).__name__, "attributes": {}, "arrays": []}
+    for key, value in model.__dict__.items():
+        if key in _MODEL_SKIPPED:
+            continue
+        if isinstance(value, np.ndarray):
+            arrays[prefix + key] = value
+            meta["arrays"].append(key)
+        else:
+            meta["attributes"][key] = value
+    return meta
+
+
+def _load_model(meta, prefix, arrays):
+    model = _MODEL_CLASSES[meta["class"]](meta["attributes"]["n_clusters"])
+    model.__dict__.update(meta["attributes"])
+    for key in meta["arrays"]:
+        setattr(model, key, arrays[prefix + key])
+    return model
+
+
+def _save_constraint_store(store, prefix, arrays):
+    arrays[prefix + "parent"] = np.array(list(store.parent.items()), dtype=np.int64).reshape(-1, 2)
+    arrays[prefix + "size"] = np.array(list(store.size.items()), dtype=np.int64).reshape(-1, 2)
+    arrays[prefix + "cl"] = np.array([(root, other) for root, others in store.cl_roots.items() for other in others], dtype=np.int64).reshape(-1, 2)
+    #components without cannot-links still need their (empty) entry
+    arrays[prefix + "roots"] = np.array(list(store.cl_roots.keys()), dtype=np.int64)
+
+
+def _load_constraint_store(store, prefix, arrays):
+    store.parent = {int(row_id): int(parent) for row_id, parent in arrays[prefix + "parent"]}
+    store.size = {int(root): int(size) for root, size in arrays[prefix + "size"]}
+    store.cl_roots = {int(root): set() for root in arrays[prefix + "roots"]}
+    for root, other in arrays[prefix + "cl"]:
+        store.cl_roots[int(root)].add(int(other))
+
+
+def save_tree_snapshot(tree: Tree, path):
+    """write the state of a tree to a snapshot file
+
+    Args:
+        tree (Tree): the tree, its root has to be set
+        path (str): the snapshot file
+    """
+    write_tree_snapshot(collect_tree_snapshot(tree), path)
+
+
+def collect_tree_snapshot(tree: Tree) -> Dict[str, np.ndarray]:
+    """collect the state of a tree without writing it, arrays of the tree are referenced not copied
+    (results are replaced and never modified in place) so the snapshot can be written later without holding the tree
+
+    Args:
+        tree (Tree): the tree, its root has to be set
+
+    Returns:
+        Dict[str, np.ndarray]: entries of the snapshot file
+    """
+    arrays = {}
+    nodes = []
+    node_index = {}
+    for index, node in enumerate(tree.iterNodes()):
+        node_index[node.id] = index
+        prefix = "{}/".format(index)
+        node_meta = {"id": node.id, "name": node.name, "version": node.version,
+                     "parent": None if node.isRoot() else node_index[node.get_parent().id],
+                     "att_weights": node.att_weights, "hier_restrictions": node.hier_restrictions,
+                     "assigned_rows": list(node.assigned_rows.keys()), "fit_stats": node.fit_stats,
+                     "q_indikators": node.q_indikators, "applied_constraints": node.applied_constraints,
+                     "accuracy_values": node.accuracy_values, "dirty": node.dirty,
+                     "input_fingerprint": node.input_fingerprint, "partition_version": node.partition_version,
+                     "analysis": node.analysis, "analysis_key": node.analysis_key,
+                     "active_learning": {key: value for key, value in node.active_learn_obj.__dict__.items() if key != "node"},
+                     "has_data": node.data is not None, "model": None}
+        if node.data is not None and not node.isRoot():
+            #positions of the rows in the dataset of the tree
+            arrays[prefix + "rows"] = node.data.rows
+        if node.clusterObj is not None:
+            node_meta["model"] = _save_model(node.clusterObj, prefix + "model/", arrays)
+        _save_constraint_store(node.constraint_store, prefix + "constraints/", arrays)
+        nodes.append(node_meta)
+    meta = {"snapshot_version": SNAPSHOT_VERSION, "instance_id": tree.instance_id, "nodes": nodes,
+            "algorithm": getattr(tree, "algorithm", None), "data_source": tree.data_source,
+            "separator": getattr(tree, "separator", None), "columns": tree.columns,
+            "dataset_stat": _get_dataset_stat(tree.data_source) if tree.data is not None else None,
+            "settings": {key: getattr(tree, key) for key in _TREE_SETTINGS}}
+    arrays["meta"] = np.frombuffer(json.dumps(meta, default=_to_json).encode(), dtype=np.uint8)
+    return arrays
+
+
+def write_tree_snapshot(arrays: Dict[str, np.ndarray], path):
+    """write collected snapshot entries to a file (written to a temporary file first and moved into place)"""
+    tmp_path = "{}.tmp{}".format(path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_tree_snapshot(path, client=None) -> Tree:
+    """rebuild a tree from a snapshot file without calculating clusters
+
+    Args:
+        path (str): the snapshot file
+        client (mqtt.Client, optional): client of the restored tree
+
+    Returns:
+        Tree: the restored tree
+    """
+    with np.load(path, allow_pickle=False) as snapshot:
+        arrays = {key: snapshot[key] for key in snapshot.files}
+    meta = json.loads(arrays["meta"].tobytes().decode())
+    if meta["snapshot_version"] != SNAPSHOT_VERSION:
+        raise ValueError("Unsupported snapshot version {}".format(meta["snapshot_version"]))
+    tree = Tree(meta["instance_id"])
+    tree.setClient(client)
+    for key, value in meta["settings"].items():
+        setattr(tree, key, value)
+    nodes = []
+    for index, node_meta in enumerate(meta["nodes"]):
+        prefix = "{}/".format(index)
+        if node_meta["parent"] is None:
+            tree.setRoot(node_meta["id"])
+            node = tree.root
+        else:
+            parent = nodes[node_meta["parent"]]
+            node = TreeNode(tree, node_meta["id"], parent=parent, version=node_meta["version"], name=node_meta["name"])
+            parent.children.append(node)
+            tree.registerNode(node)
+        node.name, node.version = node_meta["name"], node_meta["version"]
+        nodes.append(node)
+    if meta["dataset_stat"] is not None:
+        if _get_dataset_stat(meta["data_source"]) != meta["dataset_stat"]:
+            raise ValueError("Data source {} changed since the snapshot was taken".format(meta["data_source"]))
+        tree.setInitialConfig(meta["algorithm"], meta["data_source"], meta["separator"], meta["columns"])
+        tree.loadData()
+    else:
+        tree.data_source, tree.columns = meta["data_source"], meta["columns"]
+        if meta["algorithm"] is not None:
+            tree.setInitialConfig(meta["algorithm"], meta["data_source"], meta["separator"], meta["columns"])
+    for index, (node, node_meta) in enumerate(zip(nodes, meta["nodes"])):
+        prefix = "{}/".format(index)
+        if node_meta["has_data"] and not node.isRoot():
+            node.data = tree.data.create_view(arrays[prefix + "rows"])
+        node.att_weights = node_meta["att_weights"]
+        node.hier_restrictions = node_meta["hier_restrictions"]
+        node.assigned_rows = {row_id: True for row_id in node_meta["assigned_rows"]}
+        node.fit_stats = node_meta["fit_stats"]
+        node.q_indikators = node_meta["q_indikators"]
+        node.applied_constraints = node_meta["applied_constraints"]
+        node.accuracy_values = node_meta["accuracy_values"]
+        node.dirty = node_meta["dirty"]
+        node.input_fingerprint = node_meta["input_fingerprint"]
+        node.partition_version = node_meta["partition_version"]
+        node.analysis = node_meta["analysis"]
+        node.analysis_key = tuple(node_meta["analysis_key"]) if node_meta["analysis_key"] is not None else None
+        node.active_learn_obj.__dict__.update(node_meta["active_learning"])
+        node.active_learn_obj.neighborhoods_union = set(node.active_learn_obj.neighborhoods_union)
+        if node_meta["model"] is not None:
+            node.clusterObj = _load_model(node_meta["model"], prefix + "model/", arrays)
+        _load_constraint_store(node.constraint_store, prefix + "constraints/", arrays)
+    return tree
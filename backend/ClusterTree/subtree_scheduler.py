@@ -0,0 +1,100 @@
+#parallel recalculation of independent subtrees
+#after a node is partitioned its child subtrees do not depend on each other, each of them is calculated in a forked
+#worker process that inherits the tree (and the shared data matrix) copy on write, child data stays a row index view
+#the workers send back the changed node states and the node info messages which are merged in the calling process
+import copy
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
+#tree of the calling process, inherited by the forked workers
+_scheduled_tree = None
+
+
+class PublishCollector:
+    """stands in for the mqtt client in workers, messages are published by the calling process in their original order"""
+
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, topic, payload, qos=0):
+        self.messages.append((topic, payload, qos))
+
+
+def get_node_state(node) -> Dict:
+    """calculation results of a node that are transferred from a worker"""
+    return {"id": node.id,
+            "dirty": node.dirty,
+            "input_fingerprint": node.input_fingerprint,
+            "partition_version": node.partition_version,
+            "analysis": node.analysis,
+            "analysis_key": node.analysis_key,
+            "fit_stats": node.fit_stats,
+            "q_indikators": node.q_indikators,
+            "clusterObj": node.clusterObj}
+
+
+def _state_changed(before: Dict, node) -> bool:
+    return (before["dirty"] != node.dirty or before["input_fingerprint"] != node.input_fingerprint
+            or before["partition_version"] != node.partition_version or before["analysis"] is not node.analysis
+            or before["fit_stats"] is not node.fit_stats)
+
+
+def _calculate_subtree(node_id, inputs_changed, seed):
+    """calculate the subtree of a node in a worker process
+
+    Returns:
+        Tuple[List[Dict], List[Tuple]]: states of all nodes of the subtree that changed (parents first) and published messages
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    tree = _scheduled_tree
+    #subtrees of the worker are calculated one after another
+    tree.subtree_jobs = 1
+    tree.client = PublishCollector()
+    node = tree.getNodeById(node_id)
+    before = {sub_node.id: get_node_state(sub_node) for sub_node in tree.iterNodes(node)}
+    node.calculate_cluster(inputs_changed=inputs_changed)
+    states = []
+    for sub_node in tree.iterNodes(node):
+        if sub_node.id in before and not _state_changed(before[sub_node.id], sub_node):
+            continue
+        state = get_node_state(sub_node)
+        if state["clusterObj"] is not None:
+            #cached weighted matrix and callback are not sent back
+            state["clusterObj"] = copy.copy(state["clusterObj"])
+            state["clusterObj"].X_weighted = None
+            state["clusterObj"].callback = None
+        states.append(state)
+    return states, tree.client.messages
+
+
+def fork_available() -> bool:
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def calculate_subtrees(tree, nodes: List, inputs_changed: bool, n_jobs: int) -> Dict:
+    """calculate the subtrees of the given sibling nodes in a pool of forked processes
+
+    Args:
+        tree (Tree): tree of the nodes
+        nodes (List[TreeNode]): roots of the subtrees, their data must be set
+        inputs_changed (bool): passed on to calculate_cluster of the nodes
+        n_jobs (int): maximum number of worker processes
+
+    Returns:
+        Dict: node id -> (changed node states, published messages) of its subtree
+    """
+    global _scheduled_tree
+    seeds = [int(seed) for seed in np.random.randint(0, 2**31 - 1, size=len(nodes))]
+    _scheduled_tree = tree
+    try:
+        #fork does not re-import the main module (mqtt backend) in the workers
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(nodes)), mp_context=multiprocessing.get_context("fork")) as pool:
+            futures = {node.id: pool.submit(_calculate_subtree, node.id, inputs_changed, seed) for node, seed in zip(nodes, seeds)}
+            return {node_id: future.result() for node_id, future in futures.items()}
+    finally:
+        _scheduled_tree = None
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from ClusterTree.assignment import assign_labels, centers_from_sums, cluster_sums_counts, compile_restrictions, constrained_objective, weighted_distances
+from ClusterTree.pairwise_constraints import build_constraint_store, preprocess_constraints
+from ClusterTree.test_clusterCalculation import make_model
+from conftest import make_blobs, seed_all
+
+ML = [(0, 1), (1, 4), (10, 11), (20, 21)]
+CL = [(0, 10), (4, 20), (30, 31)]
+
+
+def test_assignment_equals_sequential_assignment_without_constraints():
+    X, _ = make_blobs(n_clusters=4)
+    model = make_model(X, 4)
+    constraints = build_constraint_store([], [], X.shape[0])
+    centers = model.cluster_centers
+    np.testing.assert_array_equal(model._assign_clusters(X, centers, constraints, model.w),
+                                  model._assign_clusters_sequential(X, centers, constraints, model.w))
+
+
+def test_assignment_equals_sequential_objective_for_constrained_rows():
+    X, _ = make_blobs(n_clusters=4)
+    model = make_model(X, 4)
+    #small penalty so constraints compete with distances
+    w = 50.0
+    constraints = build_constraint_store(ML, CL, X.shape[0])
+    centers = model.cluster_centers
+    cost = weighted_distances(X, centers, model.att_weights)
+    seed_all(3)
+    labels = assign_labels(cost, constraints, w)
+
+    #rows in the same order with the objective of the original implementation
+    ml_graph, cl_graph, _ = preprocess_constraints(ML, CL, X.shape[0])
+    expected = np.argmin(cost, axis=1)
+    expected[constraints.constrained] = -1
+    seed_all(3)
+    for x_i in np.random.permutation(constraints.constrained):
+        expected[x_i] = np.nanargmin([model._objective_function(X, x_i, centers, c_i, expected, ml_graph, cl_graph, w)
+                                      for c_i in range(4)])
+    np.testing.assert_array_equal(labels, expected)
+
+
+def test_objective_counts_violated_pairs():
+    X, _ = make_blobs(n_clusters=4)
+    labels = np.random.RandomState(0).randint(4, size=X.shape[0])
+    centers = np.array([X[labels == c_i].mean(axis=0) for c_i in range(4)])
+    ml_graph, cl_graph, _ = preprocess_constraints(ML, CL, X.shape[0])
+    violations = sum(labels[i] != labels[j] for i in ml_graph for j in ml_graph[i] if i < j)
+    violations += sum(labels[i] == labels[j] for i in cl_graph for j in cl_graph[i] if i < j)
+    objective = constrained_objective(X, centers, labels, np.ones(X.shape[1]), build_constraint_store(ML, CL, X.shape[0]), 10.0)
+    distance = 1 / 2 * np.sum((X - centers[labels]) ** 2)
+    assert np.isclose(objective, distance + 10.0 * violations)
+
+
+def test_restrictions_equal_value_penalty():
+    X, _ = make_blobs(n_clusters=4)
+    model = make_model(X, 4)
+    model.hier_rest = [[[0, "<", "0"], [1, ">=", "-5"]], [], [[2, "!=", "0"]], [[3, "<=", "1.5"], [0, ">", "-10"]]]
+    feasible = compile_restrictions(X, model.hier_rest, 4)
+    expected = np.array([[model._calc_value_penalty(x, c_i) == 0 for c_i in range(4)] for x in X])
+    np.testing.assert_array_equal(feasible, expected)
+
+
+def test_unknown_restriction_operator_is_rejected():
+    X, _ = make_blobs()
+    with pytest.raises(ValueError):
+        compile_restrictions(X, [[[0, "~", "1"]], [], []], 3)
+
+
+def test_centers_from_sums_equal_cluster_means():
+    X, _ = make_blobs(n_clusters=4)
+    labels = np.random.RandomState(1).randint(3, size=X.shape[0])
+    sums, counts = cluster_sums_counts(X, labels, 4)
+    np.testing.assert_array_equal(counts, [np.sum(labels == c_i) for c_i in range(4)])
+    previous = np.full((4, X.shape[1]), 7.0)
+    centers = centers_from_sums(sums, counts, previous)
+    np.testing.assert_allclose(centers[:3], [X[labels == c_i].mean(axis=0) for c_i in range(3)])
+    #empty cluster keeps its previous center
+    np.testing.assert_array_equal(centers[3], previous[3])
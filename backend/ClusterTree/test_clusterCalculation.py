@@ -0,0 +1,153 @@
+import random
+
+import numpy as np
+import pytest
+
+from ClusterTree.clusterCalculation import MiniBatchPCKMeans, PCKMeans
+from conftest import make_blobs, seed_all
+
+
+def make_model(X, n_clusters=3, model_class=PCKMeans, ml=[], cl=[], **params):
+    """model set up like TreeNode.fit_node does without restrictions"""
+    seed_all()
+    model = model_class(n_clusters, **params)
+    model.att_weights = np.ones(X.shape[1])
+    model.hier_rest = [[] for _ in range(n_clusters)]
+    model.init_centers(X, ml, cl)
+    return model
+
+
+def same_partition(labels, expected):
+    """labels equal up to renaming the clusters"""
+    pairs = set(zip(labels.tolist(), expected.tolist()))
+    return len(pairs) == len(set(labels.tolist())) == len(set(expected.tolist()))
+
+
+def test_fit_finds_blobs():
+    X, expected = make_blobs()
+    model = make_model(X).fit(X)
+    assert same_partition(model.labels_, expected)
+    assert model.fit_stats_["restarts"] == 1
+
+
+@pytest.mark.parametrize("n_jobs", [1, 3])
+def test_restarts_keep_best_objective(n_jobs):
+    X, _ = make_blobs(n_clusters=5)
+    single = make_model(X, 5).fit(X)
+    restarts = make_model(X, 5, n_init=4, n_jobs=n_jobs).fit(X)
+    assert restarts.fit_stats_["restarts"] == 4
+    assert restarts.objective_ <= single.objective_
+
+
+def test_pooled_restarts_equal_sequential_restarts():
+    X, _ = make_blobs(n_clusters=5)
+    sequential = make_model(X, 5, n_init=4, n_jobs=1).fit(X)
+    pooled = make_model(X, 5, n_init=4, n_jobs=2).fit(X)
+    np.testing.assert_array_equal(pooled.labels_, sequential.labels_)
+    np.testing.assert_allclose(pooled.cluster_centers_, sequential.cluster_centers_)
+    assert pooled.objective_ == pytest.approx(sequential.objective_)
+
+
+def test_objective_is_tracked_per_iteration_only_with_callback():
+    X, _ = make_blobs()
+    calls = []
+    tracked = make_model(X, callback=lambda stats: calls.append(stats["iterations"])).fit(X)
+    untracked = make_model(X).fit(X)
+    stats = tracked.fit_stats_
+    assert calls == list(range(1, stats["iterations"] + 1))
+    assert len(stats["objective"]) == len(stats["labels_changed"]) == stats["iterations"]
+    assert stats["labels_changed"][0] == X.shape[0]
+    assert untracked.fit_stats_["iterations"] == stats["iterations"]
+    assert untracked.fit_stats_["objective"] == [pytest.approx(untracked.objective_)]
+    assert stats["objective"][-1] == pytest.approx(untracked.objective_)
+    np.testing.assert_array_equal(tracked.labels_, untracked.labels_)
+
+
+def test_minibatch_finds_blobs():
+    X, expected = make_blobs(n_rows=3000)
+    model = make_model(X, model_class=MiniBatchPCKMeans, batch_size=256).fit(X)
+    assert same_partition(model.labels_, expected)
+
+
+def test_minibatch_reports_label_changes_and_calls_callback():
+    X, _ = make_blobs(n_rows=3000)
+    calls = []
+    model = make_model(X, model_class=MiniBatchPCKMeans, batch_size=256, callback=lambda stats: calls.append(stats["iterations"])).fit(X)
+    stats = model.fit_stats_
+    assert calls == list(range(1, stats["iterations"] + 1))
+    assert len(stats["labels_changed"]) == stats["iterations"]
+    assert all(isinstance(changed, int) for changed in stats["labels_changed"])
+    #all rows of the first batch are sampled for the first time
+    assert stats["labels_changed"][0] == 256
+
+
+def test_minibatch_stops_on_label_tol():
+    X, _ = make_blobs(n_rows=3000)
+    model = make_model(X, model_class=MiniBatchPCKMeans, batch_size=256, label_tol=1.0, center_tol=0.0).fit(X)
+    assert model.fit_stats_["iterations"] == 1
+    assert model.fit_stats_["converged"]
+
+
+def test_minibatch_keeps_constraints():
+    X, _ = make_blobs(n_rows=3000)
+    ml, cl = [(0, 1)], [(0, 2), (3, 6)]
+    model = make_model(X, model_class=MiniBatchPCKMeans, ml=ml, cl=cl, batch_size=256).fit(X, ml=ml, cl=cl)
+    labels = model.labels_
+    assert labels[0] == labels[1]
+    assert labels[0] != labels[2]
+    assert labels[3] != labels[6]
+
+
+@pytest.mark.parametrize("constrained", [False, True])
+def test_hamerly_equals_lloyd(constrained):
+    X, _ = make_blobs(n_rows=600, n_clusters=12)
+    ml, cl = ([(0, 1), (5, 9)], [(0, 2), (3, 15)]) if constrained else ([], [])
+    lloyd = make_model(X, 12, ml=ml, cl=cl, algorithm="lloyd", callback=lambda stats: None).fit(X, ml=ml, cl=cl)
+    hamerly = make_model(X, 12, ml=ml, cl=cl, algorithm="hamerly", callback=lambda stats: None).fit(X, ml=ml, cl=cl)
+    np.testing.assert_array_equal(hamerly.labels_, lloyd.labels_)
+    np.testing.assert_allclose(hamerly.cluster_centers_, lloyd.cluster_centers_)
+    assert hamerly.fit_stats_["iterations"] == lloyd.fit_stats_["iterations"]
+    np.testing.assert_allclose(hamerly.fit_stats_["objective"], lloyd.fit_stats_["objective"])
+
+
+def test_hamerly_respects_restrictions_and_manual_assignments():
+    X, _ = make_blobs(n_rows=600, n_clusters=12)
+    model = make_model(X, 12, algorithm="hamerly")
+    model.hier_rest[0] = [[0, "<", "0"]]
+    model.manually_assigned = [[] for _ in range(12)]
+    model.manually_assigned[3] = [7, 8]
+    model.fit(X)
+    assert (X[model.labels_ == 0, 0] < 0).all()
+    assert model.labels_[7] == model.labels_[8] == 3
+
+
+def kmeans_plus_plus_reference(X, k, att_weights):
+    """k-means++ seeding as originally implemented (distances to all centroids recalculated per draw)"""
+    centroids = [X[0]]
+    for _ in range(1, k):
+        dist_sq = np.array([min(np.inner((c - x) * att_weights, (c - x) * att_weights) for c in centroids) for x in X])
+        cumulative_probs = (dist_sq / dist_sq.sum()).cumsum()
+        r = np.random.rand()
+        centroids.append(X[np.argmax(r < cumulative_probs)])
+    return np.array(centroids)
+
+
+def test_kmeans_plus_plus_draws_like_reference():
+    X, _ = make_blobs(n_clusters=6)
+    model = make_model(X, 6)
+    model.att_weights = np.array([1.0, 2.0, 0.5, 1.0])
+    model.X_weighted = None
+    seed_all(5)
+    centers = model.kmeans_plus_plus_init(X, 6)
+    #kmeans_plus_plus_init seeds numpy from random
+    seed_all(5)
+    np.random.seed(random.randrange(0, 10000))
+    np.testing.assert_array_equal(centers, kmeans_plus_plus_reference(X, 6, model.att_weights))
+
+
+def test_kmeans_plus_plus_keeps_previous_centers():
+    X, _ = make_blobs(n_clusters=4)
+    model = make_model(X, 4)
+    centers = model.kmeans_plus_plus_init(X, 4, prev_cent=X[[5, 6]])
+    np.testing.assert_array_equal(centers[:2], X[[5, 6]])
+    assert len(centers) == 4
@@ -0,0 +1,84 @@
+import numpy as np
+
+
+def get_results(tree):
+    return {node.id: (node.att_weights, node.clusterObj, node.data, node.analysis) for node in tree.iterNodes()}
+
+
+def change_weights(tree, node_id, weights):
+    with tree.history.record("set_attribute_weights"):
+        tree.getNodeById(node_id).set_attribute_weights(weights)
+
+
+def test_undo_and_redo_swap_node_states(make_tree):
+    tree = make_tree(n_grandchildren=2)
+    tree.calculateClusters()
+    before = get_results(tree)
+    change_weights(tree, "root", [1, 4, 1, 1, 1])
+    after = get_results(tree)
+    assert after["root"][1] is not before["root"][1]
+    assert tree.history.get_status() == {"undo": ["set_attribute_weights"], "redo": []}
+
+    n_messages = len(tree.client.messages)
+    assert tree.history.undo() == "set_attribute_weights"
+    restored = get_results(tree)
+    for node_id, (weights, model, data, analysis) in before.items():
+        assert restored[node_id][0] == weights
+        assert restored[node_id][1] is model
+        assert restored[node_id][2] is data
+        assert restored[node_id][3] is analysis
+    #node infos of the changed nodes are published again, nothing is recalculated
+    assert len(tree.client.messages) > n_messages
+    tree.calculateClusters()
+    assert get_results(tree) == restored
+
+    assert tree.history.redo() == "set_attribute_weights"
+    assert get_results(tree) == after
+    assert not tree.history.can_redo()
+
+
+def test_history_versions_do_not_keep_caches(make_tree):
+    tree = make_tree(n_grandchildren=2)
+    tree.calculateClusters()
+    weights = tree.getNodeById("c0").att_weights
+    change_weights(tree, "c0", [2, 1, 1, 1, 1])
+    change_weights(tree, "c0", [3, 1, 1, 1, 1])
+    for _, changes in tree.history.undo_stack:
+        for node, state, _ in changes:
+            if state["clusterObj"] is not None and state["clusterObj"] is not node.clusterObj:
+                assert state["clusterObj"].X_weighted is None
+            if state["data"] is not None and state["data"] is not node.data:
+                assert state["data"].matrix is None
+    tree.history.undo()
+    tree.history.undo()
+    #dropped caches are rebuilt on access
+    c0 = tree.getNodeById("c0")
+    assert c0.att_weights == weights
+    assert c0.data.get_data_as_nparray_no_class().shape == (c0.data.get_length(), 5)
+
+
+def test_new_operation_drops_redo_and_structure_changes_clear_history(make_tree):
+    tree = make_tree(n_grandchildren=2)
+    tree.calculateClusters()
+    change_weights(tree, "root", [1, 4, 1, 1, 1])
+    tree.history.undo()
+    change_weights(tree, "root", [1, 1, 4, 1, 1])
+    assert tree.history.get_status() == {"undo": ["set_attribute_weights"], "redo": []}
+    tree.getNodeById("c0").addChild("c0_new", "c0_new")
+    assert not tree.history.can_undo()
+
+
+def test_undo_restores_manual_assignments(make_tree):
+    tree = make_tree()
+    tree.calculateClusters()
+    c0, c1 = tree.getNodeById("c0"), tree.getNodeById("c1")
+    row_id = int(c0.data.get_row_ids()[0])
+    labels = tree.root.clusterObj.labels_
+    with tree.history.record("reassign_instance_clust"):
+        c1.assign_row_to_cluster(row_id)
+        tree.calculateClusters()
+    assert row_id in c1.data.get_row_ids()
+    tree.history.undo()
+    assert row_id not in c1.assigned_rows
+    assert row_id in c0.data.get_row_ids()
+    np.testing.assert_array_equal(tree.root.clusterObj.labels_, labels)
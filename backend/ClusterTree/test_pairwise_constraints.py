@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from ClusterTree.pairwise_constraints import IncrementalConstraintStore, build_constraint_store, preprocess_constraints
+
+
+def random_constraints(n, n_ml, n_cl, seed):
+    """random must-links and cannot-links that do not contradict each other"""
+    rng = np.random.RandomState(seed)
+    groups = rng.randint(8, size=n)
+    ml, cl = [], []
+    while len(ml) < n_ml or len(cl) < n_cl:
+        i, j = rng.randint(n, size=2)
+        if i == j:
+            continue
+        if groups[i] == groups[j] and len(ml) < n_ml:
+            ml.append((int(i), int(j)))
+        elif groups[i] != groups[j] and len(cl) < n_cl:
+            cl.append((int(i), int(j)))
+    return ml, cl
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_store_equals_constraint_graphs(seed):
+    ml, cl = random_constraints(60, 40, 30, seed)
+    store = build_constraint_store(ml, cl, 60)
+    ml_graph, cl_graph, neighborhoods = preprocess_constraints(ml, cl, 60)
+    store_ml, store_cl = store.to_graphs()
+    assert store_ml == ml_graph
+    assert store_cl == cl_graph
+    assert sorted(map(sorted, store.get_neighborhoods())) == sorted(map(sorted, neighborhoods))
+
+
+def test_store_counts_violations():
+    ml, cl = random_constraints(60, 40, 30, 3)
+    store = build_constraint_store(ml, cl, 60)
+    ml_graph, cl_graph, _ = preprocess_constraints(ml, cl, 60)
+    labels = np.random.RandomState(0).randint(3, size=60)
+    violations = sum(labels[i] != labels[j] for i in ml_graph for j in ml_graph[i] if i < j)
+    violations += sum(labels[i] == labels[j] for i in cl_graph for j in cl_graph[i] if i < j)
+    assert store.count_violations(labels, 3) == violations
+
+
+def test_inconsistent_constraints_are_rejected():
+    with pytest.raises(Exception):
+        build_constraint_store([(0, 1), (1, 2)], [(0, 2)], 5)
+
+
+def test_subset_addresses_rows_by_position():
+    store = build_constraint_store([(1, 3)], [(3, 4)], 5)
+    subset = store.subset(np.array([4, 3, 1]))
+    assert subset.get_neighborhoods() == [[1, 2]]
+    np.testing.assert_array_equal(subset.constrained, [0, 1, 2])
+
+
+def test_incremental_store_equals_store_of_all_answers():
+    store = IncrementalConstraintStore()
+    assert store.add_neighborhoods([[10, 11], [20]]) == {10, 11, 20}
+    #a known neighborhood only touches the components that changed
+    assert store.add_neighborhoods([[10, 11], [20, 21], [30]]) == {10, 11, 20, 21, 30}
+    assert store.add_neighborhoods([[10, 11], [20, 21], [30]]) == set()
+    assert len(store) == 5
+
+    #node with rows 30, 21, 10, 20 at positions 0..3 (row 11 is not part of the node)
+    row_ids = np.array([30, 21, 10, 20])
+    get_positions = lambda ids: np.array([np.flatnonzero(row_ids == row_id)[0] if row_id in row_ids else -1 for row_id in ids])
+    ml, cl = store.get_applicable_constraints(get_positions)
+    node_store = build_constraint_store(ml, cl, len(row_ids))
+    ml_graph, cl_graph = node_store.to_graphs()
+    assert ml_graph == {0: set(), 1: {3}, 2: set(), 3: {1}}
+    assert cl_graph == {0: {1, 2, 3}, 1: {0, 2}, 2: {0, 1, 3}, 3: {0, 2}}
+
+
+def test_incremental_store_rejects_inconsistent_answers():
+    store = IncrementalConstraintStore()
+    store.add_neighborhoods([[1, 2], [3]])
+    with pytest.raises(Exception):
+        store.add_neighborhoods([[1, 3]])
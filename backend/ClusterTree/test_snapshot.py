@@ -0,0 +1,59 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from ClusterTree.snapshot import load_tree_snapshot, save_tree_snapshot
+from conftest import RecordingClient
+
+
+def test_snapshot_restores_tree_without_calculating(make_tree, tmp_path):
+    tree = make_tree(n_grandchildren=2, restart_jobs=2, subtree_jobs=3, subtree_min_rows=10, recluster_n_init=5)
+    tree.getNodeById("c1").set_attribute_weights([1, 2, 1, 1, 1])
+    tree.calculateClusters()
+    path = str(tmp_path / "tree.npz")
+    save_tree_snapshot(tree, path)
+    restored = load_tree_snapshot(path, RecordingClient())
+    try:
+        assert [node.id for node in restored.iterNodes()] == [node.id for node in tree.iterNodes()]
+        for key in ("restart_jobs", "subtree_jobs", "subtree_min_rows", "recluster_n_init"):
+            assert getattr(restored, key) == getattr(tree, key)
+        for node in tree.iterNodes():
+            restored_node = restored.getNodeById(node.id)
+            assert restored_node.att_weights == node.att_weights
+            assert restored_node.analysis == node.analysis
+            np.testing.assert_array_equal(restored_node.data.get_row_ids(), node.data.get_row_ids())
+            if node.clusterObj is not None:
+                np.testing.assert_array_equal(restored_node.clusterObj.labels_, node.clusterObj.labels_)
+                np.testing.assert_array_equal(restored_node.clusterObj.cluster_centers_, node.clusterObj.cluster_centers_)
+        #nothing changed since the snapshot --> recalculation reuses every node
+        restored.calculateClusters()
+        assert all(not node.dirty for node in restored.iterNodes())
+        for node in tree.iterNodes():
+            if node.clusterObj is not None:
+                np.testing.assert_array_equal(restored.getNodeById(node.id).clusterObj.labels_, node.clusterObj.labels_)
+    finally:
+        restored.release_data()
+
+
+def test_snapshot_of_changed_data_source_is_rejected(make_tree, blobs_csv, tmp_path):
+    tree = make_tree()
+    tree.calculateClusters()
+    path = str(tmp_path / "tree.npz")
+    save_tree_snapshot(tree, path)
+    with open(blobs_csv, "a") as f:
+        f.write("1,1,1,1,x,0\n")
+    os.utime(blobs_csv, ns=(0, os.stat(blobs_csv).st_mtime_ns + 1))
+    with pytest.raises(ValueError):
+        load_tree_snapshot(path)
+
+
+def test_snapshot_loads_without_pickle(make_tree, tmp_path):
+    tree = make_tree()
+    tree.calculateClusters()
+    path = str(tmp_path / "tree.npz")
+    save_tree_snapshot(tree, path)
+    with np.load(path, allow_pickle=False) as snapshot:
+        meta = json.loads(snapshot["meta"].tobytes().decode())
+    assert meta["settings"]["subtree_min_rows"] == tree.subtree_min_rows
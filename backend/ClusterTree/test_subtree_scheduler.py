@@ -0,0 +1,69 @@
+import json
+
+import numpy as np
+import pytest
+
+import ClusterTree.TreeNode as tree_node_module
+from ClusterTree.subtree_scheduler import fork_available
+
+pytestmark = pytest.mark.skipif(not fork_available(), reason="subtrees are only calculated in parallel with fork")
+
+
+def published_node_ids(tree):
+    return [json.loads(payload)["node_id"] for _, payload in tree.client.messages]
+
+
+def calculate_results(tree):
+    tree.calculateClusters()
+    return {node.id: node.clusterObj.labels_ for node in tree.iterNodes() if node.clusterObj is not None}
+
+
+@pytest.fixture
+def dispatched(monkeypatch):
+    """number of subtrees handed to the process pool per dispatch"""
+    calls = []
+    calculate_subtrees = tree_node_module.calculate_subtrees
+
+    def record(tree, nodes, inputs_changed, n_jobs):
+        calls.append(len(nodes))
+        return calculate_subtrees(tree, nodes, inputs_changed, n_jobs)
+
+    monkeypatch.setattr(tree_node_module, "calculate_subtrees", record)
+    return calls
+
+
+def test_parallel_subtrees_are_merged_like_sequential_ones(make_tree, dispatched):
+    sequential = make_tree(n_grandchildren=2)
+    sequential.calculateClusters()
+    parallel = make_tree(n_grandchildren=2, subtree_jobs=3, subtree_min_rows=0)
+    first = calculate_results(parallel)
+    assert dispatched == [3]
+    assert published_node_ids(parallel) == published_node_ids(sequential)
+    assert all(not node.dirty for node in parallel.iterNodes())
+    for node in parallel.iterNodes():
+        if node.clusterObj is not None:
+            labels = node.clusterObj.labels_
+            for index, child in enumerate(node.get_children()):
+                np.testing.assert_array_equal(child.data.get_row_ids(), node.data.get_row_ids()[labels == index])
+    #workers are seeded from the calling process
+    second = calculate_results(make_tree(n_grandchildren=2, subtree_jobs=3, subtree_min_rows=0))
+    assert first.keys() == second.keys()
+    for node_id in first:
+        np.testing.assert_array_equal(first[node_id], second[node_id])
+
+
+def test_parallel_recalculation_reuses_unchanged_subtrees(make_tree, dispatched):
+    tree = make_tree(n_grandchildren=2, subtree_jobs=3, subtree_min_rows=0)
+    tree.calculateClusters()
+    dispatched.clear()
+    tree.getNodeById("c1").set_attribute_weights([1, 2, 1, 1, 1])
+    tree.calculateClusters()
+    #only one subtree changed --> calculated in the calling process
+    assert dispatched == []
+    assert all(not node.dirty for node in tree.iterNodes())
+
+
+def test_leaves_and_small_subtrees_are_not_dispatched(make_tree, dispatched):
+    make_tree(subtree_jobs=3, subtree_min_rows=0).calculateClusters()
+    make_tree(n_grandchildren=2, subtree_jobs=3).calculateClusters()
+    assert dispatched == []
@@ -0,0 +1,90 @@
+import json
+
+import numpy as np
+import pytest
+
+from ClusterTree.clusterCalculation import MiniBatchPCKMeans, PCKMeans
+from ClusterTree.test_clusterCalculation import same_partition
+
+
+def blob_labels(node):
+    """blob of every row of a node, rows of the blobs data set alternate between the blobs"""
+    return node.data.get_row_ids() % 3
+
+
+@pytest.mark.parametrize("restart_jobs", [1, 2])
+def test_re_cluster_runs_one_restart_per_process_by_default(make_tree, restart_jobs):
+    tree = make_tree(restart_jobs=restart_jobs)
+    tree.calculateClusters()
+    assert tree.root.fit_stats["restarts"] == 1
+    tree.root.re_cluster()
+    assert tree.root.fit_stats["restarts"] == restart_jobs
+
+
+def test_re_cluster_restarts_can_be_set(make_tree):
+    tree = make_tree(recluster_n_init=3)
+    tree.calculateClusters()
+    tree.root.re_cluster()
+    assert tree.root.fit_stats["restarts"] == 3
+
+
+def test_large_nodes_use_minibatch_and_keep_centers_when_switching(make_tree):
+    tree = make_tree(minibatch_threshold=100)
+    tree.calculateClusters()
+    root = tree.root
+    assert isinstance(root.clusterObj, MiniBatchPCKMeans)
+    expected = blob_labels(root)
+    assert same_partition(root.clusterObj.labels_, expected)
+    #children are below the threshold
+    assert all(type(child.clusterObj) is not MiniBatchPCKMeans for child in root.get_children())
+    centers = root.clusterObj.cluster_centers_
+    tree.minibatch_threshold = 100000
+    root.mark_dirty()
+    tree.calculateClusters()
+    assert type(root.clusterObj) is PCKMeans
+    #switching the variant continues from the previous centers
+    assert same_partition(root.clusterObj.labels_, expected)
+    np.testing.assert_allclose(root.clusterObj.cluster_centers_, centers, atol=0.5)
+
+
+def test_recalculation_reuses_unchanged_subtrees(make_tree):
+    tree = make_tree(n_grandchildren=2)
+    tree.calculateClusters()
+    models = {node.id: node.clusterObj for node in tree.iterNodes()}
+    tree.calculateClusters()
+    assert {node.id: node.clusterObj for node in tree.iterNodes()} == models
+
+    tree.getNodeById("c1").set_attribute_weights([1, 3, 1, 1, 1])
+    tree.calculateClusters()
+    refit = {node.id for node in tree.iterNodes() if node.clusterObj is not models[node.id]}
+    assert refit == {"c1"}
+    assert all(not node.dirty for node in tree.iterNodes())
+
+
+def published_node_ids(tree):
+    return [json.loads(payload)["node_id"] for _, payload in tree.client.messages]
+
+
+def test_manual_assignment_refits_from_previous_result(make_tree):
+    tree = make_tree(n_grandchildren=2)
+    tree.calculateClusters()
+    c0, c1 = tree.getNodeById("c0"), tree.getNodeById("c1")
+    row_id = int(c0.data.get_row_ids()[0])
+    c1.assign_row_to_cluster(row_id)
+    tree.root.calculate_cluster(touched_row_ids=[row_id])
+    assert tree.root.fit_stats["warm_start"]
+    assert row_id in c1.data.get_row_ids()
+    assert row_id not in c0.data.get_row_ids()
+
+
+def test_warm_start_without_label_changes_publishes_node_infos(make_tree):
+    tree = make_tree(n_grandchildren=2)
+    tree.calculateClusters()
+    c1 = tree.getNodeById("c1")
+    row_id = int(c1.data.get_row_ids()[0])
+    tree.client.messages.clear()
+    c1.assign_row_to_cluster(row_id)
+    tree.root.calculate_cluster(touched_row_ids=[row_id])
+    assert tree.root.clusterObj.n_changed_ == 0
+    assert tree.root.fit_stats["warm_start"]
+    assert sorted(published_node_ids(tree)) == sorted(node.id for node in tree.iterNodes())
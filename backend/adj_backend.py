@@ -1,28 +1,72 @@
 from collections import deque
 from typing import List, Tuple
 import paho.mqtt.client as mqtt
+import hashlib
 import json
+import os
 import threading
+import time
 from ClusterTree.Tree import Tree
+from ClusterTree.snapshot import collect_tree_snapshot, load_tree_snapshot, write_tree_snapshot
 import pandas as pd
 
 # list with all active connected sessions
 sessions: List[Tuple[Tree, threading.Lock, deque]] = []
+#guards sessions, the list is only changed in place while holding it (mqtt thread and task threads add and remove sessions)
+sessions_lock = threading.RLock()
+#instance id -> time the last task of the session finished
+session_last_used = {}
+#sessions without tasks for this many seconds are ended and release their dataset
+SESSION_TIMEOUT = float(os.environ.get("INTREF_SESSION_TIMEOUT_S", 24 * 3600))
+#expired sessions and snapshots are removed every this many seconds in the background
+HOUSEKEEPING_INTERVAL = float(os.environ.get("INTREF_HOUSEKEEPING_INTERVAL_S", 600))
+#sessions are saved here after operations that changed them, the first task of an instance restores its snapshot
+SNAPSHOT_DIR = os.environ.get("INTREF_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "session_snapshots"))
+#snapshots are written this many seconds after the last change of a session, changes in between are written once
+SNAPSHOT_DELAY = float(os.environ.get("INTREF_SNAPSHOT_DELAY_S", 5))
+#snapshots that were not written for this many seconds are deleted
+SNAPSHOT_MAX_AGE = float(os.environ.get("INTREF_SNAPSHOT_MAX_AGE_S", 7 * 24 * 3600))
+#operations that change the state of a session
+SNAPSHOT_TOPICS = {"clustering_communicator/backend/" + topic for topic in ("register_root", "config_datasc_algo", "add_node",
+    "change_name", "re_cluster", "remove_node", "set_attribute_weights", "set_node_restrictions", "reassign_instance_clust",
+    "q_answer", "undo", "redo")}
+#instance ids with changing operations queued since their last snapshot
+changed_sessions = set()
+#instance ids whose session is restored from its snapshot by the next task
+restore_pending = set()
+#instance id -> timer writing the last collected snapshot of the session
+snapshot_timers = {}
+snapshot_timers_lock = threading.Lock()
+#snapshot files are written and deleted one at a time
+snapshot_write_lock = threading.Lock()
 
 # Thread management on session instance level to ensure orderly computation of request for each session
 def manage_tasks(instance_id):
-    try:
-        acquired = get_session_lock(instance_id).acquire(timeout=5)
-        if acquired:
-            taskqueue = get_session_deque(instance_id)
+    #session is looked up once, it may be restored or ended by one of its tasks
+    _, lock, taskqueue = get_session(instance_id)
+    #tasks queued while another thread held the lock are picked up after it was released
+    while len(taskqueue) > 0 and lock.acquire(timeout=5):
+        try:
+            restore_session(instance_id)
+            changed = False
             while len(taskqueue) > 0:
+                #changing operations are marked before their task is queued
+                if instance_id in changed_sessions:
+                    changed_sessions.discard(instance_id)
+                    changed = True
                 t = taskqueue.popleft()
                 t.start()
                 t.join()
-            get_session_lock(instance_id).release()
-    except Exception as e:
-        print(e)
-        get_session_lock(instance_id).release()
+            with sessions_lock:
+                session = next((session for session in sessions if session[1] is lock), None)
+            if session != None:
+                session_last_used[instance_id] = time.time()
+                if changed:
+                    schedule_snapshot(session[0])
+        except Exception as e:
+            print(e)
+        finally:
+            lock.release()
 
 #creates new session
 def new_session(instance_id: str):
@@ -30,8 +74,129 @@ def new_session(instance_id: str):
     global client
     tree = Tree(instance_id)
     tree.setClient(client)
-    sessions.append((tree, threading.Lock(),  deque()))
-    return get_session(instance_id)
+    if os.path.isfile(get_snapshot_path(instance_id)):
+        restore_pending.add(instance_id)
+    session = (tree, threading.Lock(),  deque())
+    with sessions_lock:
+        sessions.append(session)
+        session_last_used[instance_id] = time.time()
+    return session
+
+def end_session(instance_id, remove_snapshot=False):
+    """remove session and release its dataset, later messages of the instance start a new session (restored from
+    its snapshot unless it is removed)"""
+    global sessions
+    with sessions_lock:
+        tree = next((tree for tree, _, _ in sessions if tree.instance_id == instance_id), None)
+        if tree == None:
+            return
+        sessions[:] = [session for session in sessions if session[0] is not tree]
+        session_last_used.pop(instance_id, None)
+        restore_pending.discard(instance_id)
+    tree.release_data()
+    if remove_snapshot:
+        delete_snapshot(instance_id)
+    print("ended session " + instance_id)
+
+def expire_sessions():
+    """end sessions without tasks for longer than SESSION_TIMEOUT"""
+    now = time.time()
+    with sessions_lock:
+        current_sessions = list(sessions)
+    for tree, lock, taskqueue in current_sessions:
+        if now - session_last_used.get(tree.instance_id, now) < SESSION_TIMEOUT or len(taskqueue) > 0:
+            continue
+        #sessions running a task are kept
+        if lock.acquire(blocking=False):
+            try:
+                end_session(tree.instance_id)
+            finally:
+                lock.release()
+
+def run_housekeeping():
+    """end expired sessions and delete expired snapshots every HOUSEKEEPING_INTERVAL seconds, runs on a timer
+    thread so file operations do not block the mqtt network loop"""
+    try:
+        expire_sessions()
+        prune_snapshots()
+    except Exception as e:
+        print(e)
+    timer = threading.Timer(HOUSEKEEPING_INTERVAL, run_housekeeping)
+    timer.daemon = True
+    timer.start()
+
+
+def get_snapshot_path(instance_id):
+    return os.path.join(SNAPSHOT_DIR, hashlib.sha1(instance_id.encode()).hexdigest() + ".npz")
+
+def schedule_snapshot(tree: Tree):
+    """collect the snapshot of a changed session (task lock is held) and write it SNAPSHOT_DELAY seconds later in
+    the background, sessions without root are skipped"""
+    if not tree.nodes:
+        return
+    try:
+        arrays = collect_tree_snapshot(tree)
+    except Exception as e:
+        print("could not save session " + tree.instance_id + ": " + str(e))
+        return
+    with snapshot_timers_lock:
+        if tree.instance_id in snapshot_timers:
+            snapshot_timers[tree.instance_id].cancel()
+        timer = threading.Timer(SNAPSHOT_DELAY, write_snapshot, args=(tree.instance_id, arrays))
+        timer.daemon = True
+        snapshot_timers[tree.instance_id] = timer
+        timer.start()
+
+def write_snapshot(instance_id, arrays):
+    """write a collected snapshot, snapshots replaced by a newer one or deleted in the meantime are dropped"""
+    with snapshot_write_lock:
+        with snapshot_timers_lock:
+            if snapshot_timers.get(instance_id) is not threading.current_thread():
+                return
+            del snapshot_timers[instance_id]
+        try:
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            write_tree_snapshot(arrays, get_snapshot_path(instance_id))
+        except Exception as e:
+            print("could not save session " + instance_id + ": " + str(e))
+
+def delete_snapshot(instance_id):
+    """delete the snapshot of a session including a pending write"""
+    with snapshot_write_lock:
+        with snapshot_timers_lock:
+            timer = snapshot_timers.pop(instance_id, None)
+            if timer != None:
+                timer.cancel()
+        if os.path.isfile(get_snapshot_path(instance_id)):
+            os.remove(get_snapshot_path(instance_id))
+
+def prune_snapshots():
+    """delete snapshots that were not written for longer than SNAPSHOT_MAX_AGE"""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return
+    now = time.time()
+    with snapshot_write_lock:
+        for file_name in os.listdir(SNAPSHOT_DIR):
+            path = os.path.join(SNAPSHOT_DIR, file_name)
+            if file_name.endswith(".npz") and now - os.path.getmtime(path) > SNAPSHOT_MAX_AGE:
+                os.remove(path)
+                print("deleted expired snapshot " + file_name)
+
+def restore_session(instance_id):
+    """replace a new session by its snapshot (task lock is held), the tree is restored without recalculating it"""
+    global sessions
+    if instance_id not in restore_pending:
+        return
+    restore_pending.discard(instance_id)
+    try:
+        tree = load_tree_snapshot(get_snapshot_path(instance_id), client)
+    except Exception as e:
+        print("could not restore session " + instance_id + ": " + str(e))
+        return
+    with sessions_lock:
+        sessions[:] = [(tree, lock, taskqueue) if session_tree.instance_id == instance_id else (session_tree, lock, taskqueue)
+                       for session_tree, lock, taskqueue in sessions]
+    print("restored session " + instance_id)
 
 
 def get_session(instance_id):
@@ -44,10 +209,11 @@ def get_session(instance_id):
         Tuple[Tree, threading.Lock, deque]: Corresponding session information
     """
     global sessions
-    for i in range(0, len(sessions)):
-        if sessions[i][0].instance_id == instance_id:
-            return sessions[i]
-    return new_session(instance_id)
+    with sessions_lock:
+        for i in range(0, len(sessions)):
+            if sessions[i][0].instance_id == instance_id:
+                return sessions[i]
+        return new_session(instance_id)
 
 def get_session_tree(instance_id) -> Tree:
     global sessions
@@ -86,8 +252,10 @@ def config_datasc_algo(msg):
     algorithm = msg["algorithm"]
     #separator to use
     separator = msg["separator"]
+    #optional projection, only these columns are read from the data source
+    columns = msg.get("columns")
     tree = get_session_tree(instance_id)
-    tree.setInitialConfig(algorithm, datasc, separator)
+    tree.setInitialConfig(algorithm, datasc, separator, columns)
     tree.loadData()
     tree.calculateClusters()
 
@@ -141,7 +309,8 @@ def set_attribute_weights(msg):
     att_weights = msg["att_weights"]
     tree = get_session_tree(instance_id)
     node = tree.getNodeById(node_id)
-    node.set_attribute_weights(att_weights)
+    with tree.history.record("set_attribute_weights"):
+        node.set_attribute_weights(att_weights)
 
 def set_node_restrictions(msg):
     """set hierarchical restriction on node content"""
@@ -152,7 +321,8 @@ def set_node_restrictions(msg):
     restrictions = msg["restrictions"]
     tree = get_session_tree(instance_id)
     node = tree.getNodeById(node_id)
-    node.set_hier_restrictions(restrictions)
+    with tree.history.record("set_node_restrictions"):
+        node.set_hier_restrictions(restrictions)
 
 
 def rename_node(msg):
@@ -196,9 +366,30 @@ def reassign_instance_clust(msg):
     row_id = msg["backend_row_id"]
     tree = get_session_tree(instance_id)
     assigned_clust = tree.getNodeById(assigned_clust_id)
-    assigned_clust.assign_row_to_cluster(row_id)
     node = tree.getNodeById(node_id)
-    node.calculate_cluster()
+    with tree.history.record("reassign_instance_clust"):
+        assigned_clust.assign_row_to_cluster(row_id)
+        node.calculate_cluster(touched_row_ids=[row_id])
+
+def publish_history(tree: Tree):
+    """send the operations that can be reverted and restored to the frontend"""
+    data = dict(tree.history.get_status(), instance_id=tree.instance_id)
+    client.publish("clustering_communicator/frontend/history",
+        json.dumps(data), qos=2)
+
+def undo(msg):
+    """revert the last operation on node weights, restrictions or assignments without recalculating"""
+    tree = get_session_tree(msg["instance_id"])
+    operation = tree.history.undo()
+    print("undo " + str(operation))
+    publish_history(tree)
+
+def redo(msg):
+    """restore the last reverted operation without recalculating"""
+    tree = get_session_tree(msg["instance_id"])
+    operation = tree.history.redo()
+    print("redo " + str(operation))
+    publish_history(tree)
 
 def get_clust_result(msg):
     """retrieves clustering result and sends summary to frontend to update ui"""
@@ -206,7 +397,7 @@ def get_clust_result(msg):
     tree = get_session_tree(instance_id)
     #get each result cluster with corresponsing label
     df_list = []
-    for leaf_node in [node for node in tree.flatten() if node.is_leaf_node()]:
+    for leaf_node in tree.iterLeaves():
         df_list.append(leaf_node.data.get_df_clabel(leaf_node.name))
     res_data = pd.concat(df_list).to_csv(index=False)
     #send results to frontend to download
@@ -225,7 +416,7 @@ def request_active_query(msg):
         #get data of query
         qi0, qi1 = tree.data.get_unique_row_id_index(query[0]), tree.data.get_unique_row_id_index(query[1])
         q0, q1 = tree.data.df.iloc[qi0].values.tolist()[:-1], tree.data.df.iloc[qi1].values.tolist()[:-1]
-        q0t, q1t = tree.data.unencoded_df.iloc[qi0].values.tolist()[:-1], tree.data.unencoded_df.iloc[qi1].values.tolist()[:-1]
+        q0t, q1t = [row[:-1] for row in tree.data.get_unencoded_rows([qi0, qi1])]
         #hack for numpy tolist() not working as expected with mixed column data (does only convert some datatypes to native python for some reason)
         #--> convert other items manually
         for i in range(len(q0t)):
@@ -256,6 +447,10 @@ def q_answer(msg):
     #request next query to represent to domain expert
     request_active_query(msg)
 
+def close_session(msg):
+    """end the session of an instance, release its dataset and delete its snapshot"""
+    end_session(msg["instance_id"], remove_snapshot=True)
+
 def adjust_node(msg):
     pass
 
@@ -272,7 +467,7 @@ def get_graph_data(msg):
     tree = get_session_tree(instance_id)
     node = tree.getNodeById(node_id)
     #check if selected node exists and has data
-    if node == None or node.data == None or len(node.data.get_data()) == 0:
+    if node == None or node.data == None or node.data.get_length() == 0:
         return None
     if vis_type == 'coordinates':
         # Publish data for parallel coordinate plot
@@ -328,6 +523,8 @@ def on_mqtt_message(client, userdata, msg):
     # print(msg.topic)
     payload = json.loads(msg.payload.decode('UTF-8'))
     # print(msg.payload)
+    if msg.topic in SNAPSHOT_TOPICS:
+        changed_sessions.add(payload["instance_id"])
     if msg.topic == "clustering_communicator/backend/register_root":
         t = threading.Thread(target=register_root, args=(payload,))
         instance_id = payload["instance_id"]
@@ -384,6 +581,16 @@ def on_mqtt_message(client, userdata, msg):
         instance_id = payload["instance_id"]
         get_session_deque(instance_id).append(t)
         threading.Thread(target=manage_tasks, args=(payload["instance_id"],)).start()
+    elif msg.topic == "clustering_communicator/backend/undo":
+        t = threading.Thread(target=undo, args=(payload,))
+        instance_id = payload["instance_id"]
+        get_session_deque(instance_id).append(t)
+        threading.Thread(target=manage_tasks, args=(payload["instance_id"],)).start()
+    elif msg.topic == "clustering_communicator/backend/redo":
+        t = threading.Thread(target=redo, args=(payload,))
+        instance_id = payload["instance_id"]
+        get_session_deque(instance_id).append(t)
+        threading.Thread(target=manage_tasks, args=(payload["instance_id"],)).start()
     elif msg.topic == "clustering_communicator/backend/request_active_query":
         t = threading.Thread(target=request_active_query, args=(payload,))
         instance_id = payload["instance_id"]
@@ -399,6 +606,11 @@ def on_mqtt_message(client, userdata, msg):
         instance_id = payload["instance_id"]
         get_session_deque(instance_id).append(t)
         threading.Thread(target=manage_tasks, args=(payload["instance_id"],)).start()
+    elif msg.topic == "clustering_communicator/backend/close_session":
+        t = threading.Thread(target=close_session, args=(payload,))
+        instance_id = payload["instance_id"]
+        get_session_deque(instance_id).append(t)
+        threading.Thread(target=manage_tasks, args=(payload["instance_id"],)).start()
     else:
         print("not implemented topic" + msg.topic + " " + str(msg.payload))
 
@@ -410,6 +622,7 @@ client.on_disconnect = on_mqtt_disconnect
 client.on_message = on_mqtt_message
 client.on_log = on_log
 
+run_housekeeping()
 client.connect("129.69.209.180", 1883, 60)
 
 # subscribe
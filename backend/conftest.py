@@ -0,0 +1,79 @@
+#tests live next to the modules they cover and import them like the backend does (from this directory)
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pytest
+
+import utils
+from ClusterTree.Tree import Tree
+
+
+class RecordingClient:
+    """mqtt client stand in that keeps the published messages"""
+
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, topic, payload, qos=0):
+        self.messages.append((topic, payload))
+
+
+def make_blobs(n_rows=300, n_clusters=3, n_features=4, seed=0):
+    """rows around n_clusters well separated centers and their cluster"""
+    rng = np.random.RandomState(seed)
+    centers = rng.uniform(-20, 20, size=(n_clusters, n_features))
+    labels = np.arange(n_rows) % n_clusters
+    return centers[labels] + rng.normal(size=(n_rows, n_features)), labels
+
+
+def seed_all(seed=0):
+    np.random.seed(seed)
+    random.seed(seed)
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """dataset cache in a temporary directory"""
+    monkeypatch.setattr(utils, "DATASET_CACHE_DIR", str(tmp_path / "cache"))
+    return tmp_path
+
+
+@pytest.fixture
+def blobs_csv(cache_dir):
+    X, labels = make_blobs()
+    path = cache_dir / "blobs.csv"
+    with open(path, "w") as f:
+        f.write("a,b,c,d,kind,class\n")
+        for row, label in zip(X, labels):
+            f.write(",".join("{:.6f}".format(value) for value in row) + ",{},{}\n".format("xyz"[label], label))
+    return str(path)
+
+
+@pytest.fixture
+def make_tree(blobs_csv):
+    """builds trees on the blobs data set: root with n_children children that have n_grandchildren children each"""
+    trees = []
+
+    def make(n_children=3, n_grandchildren=0, **settings):
+        seed_all()
+        tree = Tree("test")
+        tree.setClient(RecordingClient())
+        tree.setRoot("root")
+        for key, value in settings.items():
+            setattr(tree, key, value)
+        tree.setInitialConfig("pckmeans", blobs_csv, ",")
+        tree.loadData()
+        for i in range(n_children):
+            tree.root.addChild("c{}".format(i), "c{}".format(i))
+            for j in range(n_grandchildren):
+                tree.getNodeById("c{}".format(i)).addChild("c{}_{}".format(i, j), "c{}_{}".format(i, j))
+        trees.append(tree)
+        return tree
+
+    yield make
+    for tree in trees:
+        tree.release_data()
@@ -1,9 +1,56 @@
-import copy
 import utils as ih
 import clustering as c
 import numpy as np
-from collections import defaultdict
-from sklearn.preprocessing import LabelEncoder
+import pandas as pd
+
+
+#column holding the unique row id in frames with row ids
+ROW_ID_COLUMN = "un_row_id_random12345613"
+
+
+def _view_frame(name):
+    """frame attribute of a container, frames that are not stored are built on first access (see build_frame)"""
+    def get_frame(self):
+        if self.frames.get(name) is None:
+            self.frames[name] = self.build_frame(name)
+        return self.frames.get(name)
+
+    def set_frame(self, frame):
+        self.frames[name] = frame
+
+    return property(get_frame, set_frame)
+
+
+class CodeTable:
+    """
+    Codes of the values of a string column (position of the value in the sorted values, same as LabelEncoder codes),
+    built once per dataset and shared by all containers of the dataset
+    """
+
+    def __init__(self, categories):
+        #code -> value
+        self.categories = pd.Index(categories, dtype=object)
+        #value -> code
+        self.codes = {value: code for code, value in enumerate(self.categories)}
+
+    def __len__(self):
+        return len(self.categories)
+
+    def encode(self, value) -> int:
+        """code of a single value, KeyError for unknown values"""
+        return self.codes[value]
+
+    def encode_many(self, values) -> np.array:
+        """codes of many values at once, -1 for unknown values"""
+        return self.categories.get_indexer(values)
+
+    def decode(self, code):
+        """value of a single code"""
+        return self.categories[code]
+
+    def decode_many(self, codes) -> pd.Categorical:
+        """values of many codes at once as categorical sharing the codes (-1 for missing values)"""
+        return pd.Categorical.from_codes(codes, self.categories)
 
 
 class DataContainer:
@@ -16,8 +63,10 @@ class DataContainer:
     cluster_algo = ""
 
     # Stored data
-    df = None
-    data = None
+    df = _view_frame("df")
+    unencoded_df = _view_frame("unencoded_df")
+    df_with_unique_rowid = _view_frame("df_with_unique_rowid")
+    unencoded_df_unique_row_id = _view_frame("unencoded_df_unique_row_id")
     header = None
 
     # Stored clustering results
@@ -30,33 +79,104 @@ class DataContainer:
         self.dataset = dataset
         self.cluster_algo = c_algo
         self.separator = separator
+        self.encoding = None
+        #columns read from the dataset (None for all columns)
+        self.columns = None
+        #child containers are views on the container of the whole dataset (store), rows are positions in the store
+        #containers of sessions (see dataset_registry) are views without rows and share all data of the store
+        self.store: DataContainer = None
+        self.rows: np.array = None
+        #materialized frames (df, unencoded_df, ...) and row list
+        self.frames = {}
+        self.row_list = None
+        #unique row id per row (only stored by the container of the whole dataset)
+        self.row_ids: np.array = None
         self.df_with_unique_rowid = None
         self.string_columns = None
         self.unencoded_data = None
-        self.d = defaultdict(LabelEncoder)
+        #string column -> code table of the column
+        self.code_tables = {}
+        #float matrix without class column and its attribute weighted version, shared by clustering, active learning and quality metrics
+        self.matrix = None
+        self.weighted_matrix = None
+        self.matrix_weights = None
+        #unique row ids in ascending order and their positions in the container, used to look up rows by id
+        self.sorted_row_ids = None
+        self.sorted_row_pos = None
 
     def from_data_container(data_container: "DataContainer"):
         n_container =  DataContainer(data_container.dataset, data_container.cluster_algo, data_container.separator)
+        n_container.encoding = data_container.encoding
+        n_container.columns = data_container.columns
         n_container.header = data_container.header
-        n_container.d = data_container.d
+        n_container.code_tables = data_container.code_tables
         n_container.string_columns = data_container.string_columns
         return n_container
 
-    def init_from_file(self):
-        self.df, self.header = ih.read_dataset(self.dataset, self.separator)
-        self.unencoded_df = copy.deepcopy(self.df)
-        self.unencoded_df_unique_row_id = copy.deepcopy(self.df)
-        self.unencoded_df_unique_row_id["un_row_id_random12345613"] = self.df.index
+    def create_view(self, positions) -> "DataContainer":
+        """container holding the rows at the given positions of this container without copying data"""
+        view = DataContainer.from_data_container(self)
+        view.store = self.get_store()
+        view.rows = self.rows[positions] if self.rows is not None else np.asarray(positions, dtype=int)
+        view.build_row_index()
+        return view
+
+    def create_session_view(self, c_algo) -> "DataContainer":
+        """container of a session on the whole dataset, frames, matrix and row index are shared with this container"""
+        view = DataContainer.from_data_container(self)
+        view.cluster_algo = c_algo
+        view.store = self.get_store()
+        view.build_row_index()
+        return view
+
+    def is_session_view(self):
+        """true if the container is a view on all rows of the store"""
+        return self.store is not None and self.rows is None
+
+    def get_memory_usage(self):
+        """bytes held by the frames and matrices of the container (memory mapped columns included)"""
+        usage = sum(frame.memory_usage(index=False, deep=True).sum() for frame in self.frames.values() if frame is not None)
+        for values in (self.matrix, self.weighted_matrix, self.row_ids, self.sorted_row_ids, self.sorted_row_pos):
+            usage += values.nbytes if values is not None else 0
+        return int(usage)
+
+    def get_store(self) -> "DataContainer":
+        """container holding the frames of the whole dataset"""
+        return self.store if self.store is not None else self
+
+    def is_loaded(self):
+        """true if the container holds data (own frames or a view on a store)"""
+        return self.store is not None or self.frames.get("df") is not None
+
+    @property
+    def data(self):
+        """rows as list of lists, built from df on first access"""
+        if self.is_session_view():
+            return self.store.data
+        if self.row_list is None and self.df is not None:
+            self.row_list = self.df.values.tolist()
+        return self.row_list
+
+    @data.setter
+    def data(self, row_list):
+        self.row_list = row_list
+
+    def init_from_file(self, encoding=None, columns=None):
+        #only the encoded frame is stored, unencoded frame and frames with row ids are built from it when requested
+        self.encoding = encoding
+        self.columns = columns
+        self.df, self.header = ih.load_dataset(self.dataset, self.separator, encoding, columns)
+        self.row_ids = self.df.index.to_numpy(dtype=int)
         self.encode_data() #handle string values
-        self.df_with_unique_rowid = copy.deepcopy(self.df)
-        self.df_with_unique_rowid["un_row_id_random12345613"] = self.df.index
+        self.build_row_index()
         #self.cluster_result, self.majority_labels, self.data_labels = c.cluster(self.df.values.tolist(), c_algo, c_param, True)
         #self.df['C_Label'] = self.data_labels
-        self.data = self.df.values.tolist()  # Data with cluster labels
+        self.data = None  # Data with cluster labels, built on first access
+        self.invalidate_matrix_cache()
 
     def get_attribute_values_for_cluster(self, attribute):
         # Wanted attribute values of the given cluster
-        clu_val = self.df[attribute].values.tolist()
+        clu_val = self.get_attribute(attribute).values.tolist()
 
         # if diagram_type == "class":
         #     # Get data for the majority class of the given cluster
@@ -72,39 +192,90 @@ class DataContainer:
 
     def encode_data(self):
         df = self.df
-        self.string_columns = [ col  for col, dt in df.dtypes.items() if dt == object]
-        self.df[self.string_columns] = self.df[self.string_columns].apply(lambda x: self.d[x.name].fit_transform(x))
+        self.string_columns = [ col  for col, dt in df.dtypes.items() if dt == object or isinstance(dt, pd.CategoricalDtype)]
+        for col in self.string_columns:
+            #codes of categoricals from the dataset cache are used as they are, values are replaced column by column
+            values = pd.Categorical(df[col].values)
+            self.code_tables[col] = CodeTable(values.categories)
+            df[col] = values.codes
+
+    def decode_frame(self, df):
+        """frame with the original values of string columns (categorical columns sharing the codes of df)"""
+        if not self.string_columns:
+            return df
+        return df.assign(**{col: self.code_tables[col].decode_many(df[col]) for col in self.string_columns})
+
+    def encode_value(self, attribute, value):
+        """code of a value of a string column, KeyError if the column is no string column or the value is unknown"""
+        return self.code_tables[attribute].encode(value)
+
+    def get_unencoded_rows(self, positions):
+        """rows at the given positions with the original values of string columns, only these rows are decoded"""
+        return self.decode_frame(self.df.iloc[positions]).values.tolist()
+
+    def build_frame(self, name):
+        """build a frame that is not stored, views take the rows of df from the store, all other frames are derived from df"""
+        if self.is_session_view():
+            return getattr(self.store, name)
+        if name == "df":
+            if self.store is None:
+                return None
+            return self.store.df.iloc[self.rows].reset_index(drop=True)
+        if self.df is None:
+            return None
+        if name == "unencoded_df":
+            return self.decode_frame(self.df)
+        if name == "df_with_unique_rowid":
+            return self.df.assign(**{ROW_ID_COLUMN: self.get_row_ids()})
+        if name == "unencoded_df_unique_row_id":
+            return self.unencoded_df.assign(**{ROW_ID_COLUMN: self.get_row_ids()})
+        return None
 
     def get_data_clabel(self, label: str):
-        data = self.df
-        data["C_Label"] = label
-        data = data.values.tolist()
-        try:
-            self.df = self.df.drop(columns=['C_Label'])
-        except:
-            pass
-        return data
+        #assign returns a new frame, frames of the store are shared with views and must not get the label column
+        return self.df.assign(C_Label=label).values.tolist()
 
     def get_df_clabel(self, label: str):
-        data = self.unencoded_df
-        data["C_Label"] = label
-        try:
-            self.df = self.df.drop(columns=['C_Label'])
-        except:
-            pass
-        return data
+        return self.unencoded_df.assign(C_Label=label)
+
+    def get_row_ids(self) -> np.array:
+        """unique row id per position"""
+        if self.is_session_view():
+            return self.store.get_row_ids()
+        if self.store is not None:
+            return self.store.get_row_ids()[self.rows]
+        return self.row_ids
+
+    def build_row_index(self):
+        """index from unique row id to position, built once per container"""
+        if self.is_session_view():
+            if self.store.sorted_row_ids is None:
+                self.store.build_row_index()
+            self.sorted_row_pos, self.sorted_row_ids = self.store.sorted_row_pos, self.store.sorted_row_ids
+            return
+        row_ids = self.get_row_ids()
+        self.sorted_row_pos = np.argsort(row_ids, kind="stable")
+        self.sorted_row_ids = row_ids[self.sorted_row_pos]
+
+    def get_unique_row_id_indices(self, row_ids) -> np.array:
+        """positions of many unique row ids at once, -1 for ids that are not part of the container"""
+        if self.sorted_row_ids is None:
+            self.build_row_index()
+        row_ids = np.asarray(row_ids, dtype=int).reshape(-1)
+        if len(self.sorted_row_ids) == 0:
+            return np.full(len(row_ids), -1, dtype=int)
+        slots = np.minimum(np.searchsorted(self.sorted_row_ids, row_ids), len(self.sorted_row_ids) - 1)
+        return np.where(self.sorted_row_ids[slots] == row_ids, self.sorted_row_pos[slots], -1)
 
     def get_unique_row_id_index(self, row_id):
-        index = self.df_with_unique_rowid.index[self.df_with_unique_rowid['un_row_id_random12345613'] == row_id].tolist()
-        if len(index) == 1:
-            return index[0]
-        return -1
+        """position of a unique row id, -1 if it is not part of the container"""
+        return int(self.get_unique_row_id_indices([row_id])[0])
 
     def get_attributes_of_dataset(self):
-        return self.df.columns.tolist()
+        return self.get_store().df.columns.tolist()
 
     def get_attributes_of_dataset_with_unique(self):
-        return self.df_with_unique_rowid.columns.tolist()
+        return self.get_attributes_of_dataset() + [ROW_ID_COLUMN]
 
     def get_attributes_of_dataset_clabel(self):
         return self.get_attributes_of_dataset() + ["C_Label"]
@@ -113,16 +284,20 @@ class DataContainer:
         return self.header
 
     def get_header_no_class(self):
-        return self.df.loc[:, self.df.columns != 'class'].columns
+        df = self.get_store().df
+        return df.loc[:, df.columns != 'class'].columns
 
     def set_df_from_unique_df(self):
-        self.df = self.df_with_unique_rowid.loc[:, self.df_with_unique_rowid.columns != 'un_row_id_random12345613']
+        self.row_ids = self.df_with_unique_rowid[ROW_ID_COLUMN].to_numpy(dtype=int)
+        self.df = self.df_with_unique_rowid.loc[:, self.df_with_unique_rowid.columns != ROW_ID_COLUMN]
+        self.build_row_index()
+        self.invalidate_matrix_cache()
 
     def set_unencoded_df_from_unencoded_unique(self):
-        self.unencoded_df = self.unencoded_df_unique_row_id.loc[:, self.unencoded_df_unique_row_id.columns != 'un_row_id_random12345613']
+        self.unencoded_df = self.unencoded_df_unique_row_id.loc[:, self.unencoded_df_unique_row_id.columns != ROW_ID_COLUMN]
 
     def set_data_from_df(self):
-        self.data = self.df.values.tolist()
+        self.data = None
 
     def get_data(self):
         return self.data
@@ -134,17 +309,15 @@ class DataContainer:
         return self.unencoded_df_unique_row_id.values.tolist()
 
     def get_data_summary(self):
-        return self.df.loc[:, self.df.columns != 'class'].describe().to_json(orient='records')
+        #statistics of the cached matrix avoid materializing the frame of views
+        matrix = pd.DataFrame(self.get_data_as_nparray_no_class(), columns=self.get_attributes_of_dataset_no_class())
+        return matrix.describe().to_json(orient='records')
 
     def get_data_table_data(self, c_as):
-        temp_table = self.unencoded_df_unique_row_id.loc[:, self.unencoded_df_unique_row_id.columns != 'class']
-        temp_table["cluster_assignment"] = c_as
-        data = temp_table.to_json(orient='records')
-        try:
-            self.unencoded_df_unique_row_id = self.unencoded_df_unique_row_id.drop(columns=['cluster_assignment'])
-        except:
-            pass
-        return data
+        #string columns are decoded with the code tables, the decoded frame of the container is not built
+        temp_table = self.decode_frame(self.df.loc[:, self.df.columns != 'class'])
+        temp_table = temp_table.assign(**{ROW_ID_COLUMN: self.get_row_ids(), "cluster_assignment": c_as})
+        return temp_table.to_json(orient='records')
 
     # def get_data_table_data(self, c_as):
     #     temp_table = self.df_with_unique_rowid.loc[:, self.df_with_unique_rowid.columns != 'class']
@@ -157,19 +330,54 @@ class DataContainer:
     #     return data
 
     def get_length(self):
-        return len(self.data)
+        if self.rows is not None:
+            return len(self.rows)
+        return len(self.df)
 
     def get_data_as_nparray(self):
         return np.array(self.data)
 
     def get_data_as_nparray_no_class(self):
-        return np.array(self.df.loc[:, self.df.columns != 'class'].values.tolist())
+        """float matrix of the data without class column, built once until the data changes (read only)"""
+        if self.matrix is None:
+            if self.is_session_view():
+                self.matrix = self.store.get_data_as_nparray_no_class()
+            elif self.store is not None:
+                self.matrix = self.store.get_data_as_nparray_no_class()[self.rows]
+            else:
+                self.matrix = self.df.loc[:, self.df.columns != 'class'].to_numpy(dtype=float)
+            self.matrix.flags.writeable = False
+        return self.matrix
+
+    def get_weighted_data_no_class(self, att_weights):
+        """data matrix without class column multiplied with the attribute weights, built once per weights (read only)"""
+        weights = tuple(float(weight) for weight in att_weights)
+        if self.weighted_matrix is None or self.matrix_weights != weights:
+            self.weighted_matrix = self.get_data_as_nparray_no_class() * np.array(weights)
+            self.weighted_matrix.flags.writeable = False
+            self.matrix_weights = weights
+        return self.weighted_matrix
+
+    def invalidate_matrix_cache(self, weights_only=False):
+        """drop cached matrices after the data (or only the attribute weights) changed"""
+        if not weights_only:
+            self.matrix = None
+        self.weighted_matrix = None
+        self.matrix_weights = None
+
+    def drop_caches(self):
+        """drop frames, row list and matrices a view built on access, they are rebuilt from the store when requested again"""
+        if self.store is None:
+            return
+        self.frames = {}
+        self.row_list = None
+        self.invalidate_matrix_cache()
 
     def get_data_true_id(self):
-        return self.df_with_unique_rowid["un_row_id_random12345613"].values.tolist()
+        return self.get_row_ids().tolist()
 
     def get_attributes_of_dataset_no_class(self):
-        return self.df.loc[:, self.df.columns != 'class'].columns.tolist()
+        return self.get_header_no_class().tolist()
 
     def get_data_without_noise(self):
         # Removes unclustered data from optics and dbscan
@@ -189,6 +397,11 @@ class DataContainer:
         return 42
 
     def get_attribute(self, attribute):
+        #single column of views is taken from the store without materializing the frame
+        if self.is_session_view():
+            return self.store.get_attribute(attribute)
+        if self.store is not None and self.frames.get("df") is None:
+            return self.store.get_attribute(attribute).iloc[self.rows].reset_index(drop=True)
         return self.df[attribute]
 
     def get_configuration(self):
@@ -198,6 +411,6 @@ class DataContainer:
         return self.cluster_result
 
     def get_attribute_range(self, attribute):
-        min_val = self.df[attribute].min()
-        max_val = self.df[attribute].max()
+        min_val = self.get_attribute(attribute).min()
+        max_val = self.get_attribute(attribute).max()
         return [int(min_val), int(max_val)]
@@ -0,0 +1,92 @@
+import os
+import threading
+from collections import OrderedDict
+
+from data_container import DataContainer
+from utils import get_source_path
+
+#memory for loaded datasets in bytes, can be set in MB with the INTREF_DATASET_BUDGET_MB environment variable
+DEFAULT_MEMORY_BUDGET = int(float(os.environ.get("INTREF_DATASET_BUDGET_MB", 1024)) * 2 ** 20)
+
+
+class DatasetRegistry:
+    """
+    Process wide registry of loaded datasets
+
+    Every dataset (source, separator, encoding, columns) is loaded once into a container that is shared read only by all
+    sessions: frames, float matrix, row index and label encoders. Sessions get a view on it and only own their
+    labels, attribute weights and constraints. Datasets stay loaded after the last session released them and are
+    evicted least recently used first as soon as all loaded datasets exceed the memory budget.
+    """
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self.lock = threading.Lock()
+        #key -> container of the whole dataset, ordered by last use
+        self.datasets = OrderedDict()
+        #key -> number of sessions using the dataset
+        self.references = {}
+
+    def get_key(self, dataset, separator, encoding=None, columns=None):
+        """key of a dataset, a replaced or modified source file (size, modification time) is loaded as a new dataset"""
+        stat = os.stat(get_source_path(dataset))
+        return (os.path.abspath(dataset), separator, encoding, tuple(columns) if columns is not None else None,
+                stat.st_size, stat.st_mtime_ns)
+
+    def acquire(self, dataset, c_algo, separator, encoding=None, columns=None) -> DataContainer:
+        """
+        Returns the container of a new session on the given dataset, the dataset is loaded on first use
+        :param dataset: the filepath to the data set
+        :param c_algo: the clustering algorithm of the session
+        :param separator: the separator used in the data set
+        :param encoding: the text encoding of the data set
+        :param columns: the columns to read (None for all columns)
+        :return: view on the shared container of the dataset
+        """
+        key = self.get_key(dataset, separator, encoding, columns)
+        with self.lock:
+            store = self.datasets.get(key)
+            if store is None:
+                store = DataContainer(dataset, c_algo, separator)
+                store.init_from_file(encoding, columns)
+                #shared matrix is built once here, sessions only add their weighted version
+                store.get_data_as_nparray_no_class()
+                self.datasets[key] = store
+                self.references[key] = 0
+            self.references[key] += 1
+            self.datasets.move_to_end(key)
+            self.evict()
+        return store.create_session_view(c_algo)
+
+    def release(self, container: DataContainer):
+        """
+        Drops the reference of a session, the dataset stays loaded until it is evicted
+        :param container: container returned by acquire
+        """
+        with self.lock:
+            #the source file may have changed since the dataset was acquired --> look up the key by the shared store
+            key = next((key for key, store in self.datasets.items() if store is container.get_store()), None)
+            if self.references.get(key, 0) == 0:
+                return
+            self.references[key] -= 1
+            self.evict()
+
+    def evict(self):
+        """evict unreferenced datasets (least recently used first) until all loaded datasets fit into the budget"""
+        usage = self.get_memory_usage()
+        for key in list(self.datasets):
+            if usage <= self.memory_budget:
+                break
+            if self.references[key] > 0:
+                continue
+            usage -= self.datasets[key].get_memory_usage()
+            del self.datasets[key]
+            del self.references[key]
+
+    def get_memory_usage(self):
+        """bytes held by all loaded datasets"""
+        return sum(store.get_memory_usage() for store in self.datasets.values())
+
+
+#registry shared by all sessions of the backend process
+datasets = DatasetRegistry()
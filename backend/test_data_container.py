@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder
+
+from data_container import CodeTable, DataContainer
+
+
+def load_container(path):
+    container = DataContainer(path, "pckmeans", ",")
+    container.init_from_file()
+    return container
+
+
+def test_code_table_equals_label_encoder():
+    values = ["b", "a", "c", "a", "b"]
+    table = CodeTable(sorted(set(values)))
+    np.testing.assert_array_equal(table.encode_many(values), LabelEncoder().fit_transform(values))
+    assert table.encode("c") == 2
+    assert table.decode(1) == "b"
+    assert table.encode_many(["d"]).tolist() == [-1]
+    assert table.decode_many(np.array([2, -1, 0])).tolist()[0] == "c"
+
+
+def test_string_columns_are_label_encoded(blobs_csv):
+    container = load_container(blobs_csv)
+    expected = pd.read_csv(blobs_csv)
+    matrix = container.get_data_as_nparray_no_class()
+    assert container.get_attributes_of_dataset_no_class() == ["a", "b", "c", "d", "kind"]
+    np.testing.assert_array_equal(matrix[:, 4], LabelEncoder().fit_transform(expected["kind"]))
+    np.testing.assert_allclose(matrix[:, :4], expected[["a", "b", "c", "d"]].values)
+
+
+def test_views_share_code_tables_and_matrix_rows(blobs_csv):
+    container = load_container(blobs_csv)
+    rows = np.array([5, 1, 7])
+    view = container.create_view(rows)
+    assert view.code_tables is container.code_tables
+    np.testing.assert_array_equal(view.get_data_as_nparray_no_class(), container.get_data_as_nparray_no_class()[rows])
+    np.testing.assert_array_equal(view.get_unique_row_id_indices(view.get_row_ids()[::-1]), [2, 1, 0])
+    assert view.get_unique_row_id_indices(np.array([container.get_row_ids()[0]])).tolist() == [-1]
+
+
+def test_weighted_matrix_is_cached_per_weights(blobs_csv):
+    container = load_container(blobs_csv)
+    weights = [1, 2, 1, 1, 0.5]
+    weighted = container.get_weighted_data_no_class(weights)
+    np.testing.assert_allclose(weighted, container.get_data_as_nparray_no_class() * weights)
+    assert container.get_weighted_data_no_class(list(weights)) is weighted
+    assert container.get_weighted_data_no_class([1, 1, 1, 1, 1]) is not weighted
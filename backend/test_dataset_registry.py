@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+
+from dataset_registry import DatasetRegistry
+
+
+def test_sessions_share_one_store(blobs_csv):
+    registry = DatasetRegistry()
+    first = registry.acquire(blobs_csv, "pckmeans", ",")
+    second = registry.acquire(blobs_csv, "pckmeans", ",")
+    assert first is not second
+    assert first.get_store() is second.get_store()
+    assert list(registry.references.values()) == [2]
+    np.testing.assert_array_equal(first.get_data_as_nparray_no_class(), second.get_data_as_nparray_no_class())
+
+
+def test_release_keeps_dataset_until_evicted(blobs_csv):
+    registry = DatasetRegistry()
+    container = registry.acquire(blobs_csv, "pckmeans", ",")
+    registry.release(container)
+    assert list(registry.references.values()) == [0]
+    assert len(registry.datasets) == 1
+    registry.memory_budget = 0
+    registry.evict()
+    assert len(registry.datasets) == 0
+
+
+def test_referenced_datasets_are_not_evicted(blobs_csv):
+    registry = DatasetRegistry(memory_budget=0)
+    container = registry.acquire(blobs_csv, "pckmeans", ",")
+    assert container.get_store() in registry.datasets.values()
+
+
+def test_changed_source_is_loaded_as_new_dataset(blobs_csv):
+    registry = DatasetRegistry()
+    before = registry.acquire(blobs_csv, "pckmeans", ",")
+    with open(blobs_csv, "a") as f:
+        f.write("1,1,1,1,x,0\n")
+    os.utime(blobs_csv, ns=(0, os.stat(blobs_csv).st_mtime_ns + 1))
+    after = registry.acquire(blobs_csv, "pckmeans", ",")
+    assert after.get_store() is not before.get_store()
+    assert after.get_length() == before.get_length() + 1
+    #release finds the dataset of the old file by its store
+    registry.release(before)
+    assert sorted(registry.references.values()) == [0, 1]
@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils
+
+
+def write_csv(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_stream_cache_matches_read_csv(cache_dir):
+    filepath = write_csv(cache_dir / "data.csv", "a,b,c\n1,0.5,x\n2,,y\n300,1.25,x\n4,2.0,\n5,3.5,z\n")
+    utils.stream_dataset_cache(filepath, ",", None, str(cache_dir / "cache_data"), chunk_rows=2)
+    cached = utils.read_dataset_cache(str(cache_dir / "cache_data"))
+    expected = pd.read_csv(filepath)
+    assert cached["a"].dtype == np.int16
+    assert cached["b"].dtype == np.float32
+    np.testing.assert_array_equal(cached["a"], expected["a"])
+    np.testing.assert_array_equal(cached["b"], expected["b"])
+    assert list(cached["c"].cat.categories) == ["x", "y", "z"]
+    assert cached["c"].cat.codes.tolist() == [0, 1, 0, -1, 2]
+
+
+def test_stream_cache_keeps_large_integers_of_mixed_chunks(cache_dir):
+    #16777217 is not exact in float32, the column only becomes a float column through the second chunk
+    filepath = write_csv(cache_dir / "data.csv", "id,x\n16777217,1\n2,2\n3,3\n0.5,4\n,5\n")
+    utils.stream_dataset_cache(filepath, ",", None, str(cache_dir / "cache_data"), chunk_rows=3)
+    cached = utils.read_dataset_cache(str(cache_dir / "cache_data"))
+    assert cached["id"].dtype == np.float64
+    np.testing.assert_array_equal(cached["id"], pd.read_csv(filepath)["id"])
+
+
+def test_stream_cache_narrows_mixed_chunks_if_exact(cache_dir):
+    filepath = write_csv(cache_dir / "data.csv", "id,x\n17,1\n2,2\n3,3\n0.5,4\n,5\n")
+    utils.stream_dataset_cache(filepath, ",", None, str(cache_dir / "cache_data"), chunk_rows=3)
+    cached = utils.read_dataset_cache(str(cache_dir / "cache_data"))
+    assert cached["id"].dtype == np.float32
+    np.testing.assert_array_equal(cached["id"], pd.read_csv(filepath)["id"])
+
+
+def test_write_cache_matches_stream_cache(cache_dir):
+    filepath = write_csv(cache_dir / "data.csv", "a,b\n1,0.1\n2,0.2\n-3,\n")
+    utils.stream_dataset_cache(filepath, ",", None, str(cache_dir / "streamed"), chunk_rows=2)
+    utils.write_dataset_cache(pd.read_csv(filepath), str(cache_dir / "written"))
+    streamed = utils.read_dataset_cache(str(cache_dir / "streamed"))
+    written = utils.read_dataset_cache(str(cache_dir / "written"))
+    assert streamed.dtypes.tolist() == written.dtypes.tolist()
+    np.testing.assert_array_equal(streamed.values, written.values)
+
+
+def test_cache_path_changes_with_source_file(cache_dir):
+    filepath = write_csv(cache_dir / "data.csv", "a\n1\n")
+    before = utils.get_dataset_cache_path(filepath, ",")
+    write_csv(cache_dir / "data.csv", "a\n1\n2\n")
+    assert utils.get_dataset_cache_path(filepath, ",") != before
+
+
+def test_load_dataset_reads_through_cache(blobs_csv):
+    df, header = utils.load_dataset(blobs_csv, ",")
+    assert os.path.isdir(utils.get_dataset_cache_path(blobs_csv, ","))
+    cached, _ = utils.load_dataset(blobs_csv, ",")
+    #columns of the cached data set are memory mapped
+    assert isinstance(cached["a"].values, np.memmap)
+    expected = pd.read_csv(blobs_csv)
+    assert list(header) == list(expected.columns)
+    for frame in (df, cached):
+        np.testing.assert_array_equal(frame[["a", "b", "c", "d", "class"]].values, expected[["a", "b", "c", "d", "class"]].values)
+        assert frame["kind"].astype(str).tolist() == expected["kind"].tolist()
+
+
+def test_load_dataset_projects_columns(blobs_csv):
+    df, header = utils.load_dataset(blobs_csv, ",", columns=["class", "b"])
+    assert list(header) == ["b", "class"]
+    np.testing.assert_array_equal(df["b"].values, pd.read_csv(blobs_csv)["b"].values.astype(df["b"].dtype))
+
+
+def test_arrow_sources_equal_csv(blobs_csv, cache_dir):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+    expected = pd.read_csv(blobs_csv)
+    table = pa.Table.from_pandas(expected, preserve_index=False)
+    pq.write_table(table, str(cache_dir / "blobs.parquet"), row_group_size=100)
+    feather.write_feather(table, str(cache_dir / "blobs.arrow"))
+    for filepath in (str(cache_dir / "blobs.parquet"), str(cache_dir / "blobs.arrow")):
+        df, header = utils.load_dataset(filepath, ",")
+        assert list(header) == list(expected.columns)
+        np.testing.assert_array_equal(df[["a", "b", "c", "d", "class"]].values, expected[["a", "b", "c", "d", "class"]].values)
+        assert list(df["kind"].cat.categories) == ["x", "y", "z"]
+        assert df["kind"].astype(str).tolist() == expected["kind"].tolist()
+
+
+def test_arrow_sources_need_pyarrow(cache_dir, monkeypatch):
+    monkeypatch.setattr(utils, "pa", None)
+    with pytest.raises(ImportError):
+        utils.read_arrow_table(str(cache_dir / "missing.parquet"))
@@ -1,25 +1,381 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
 import pandas as pd
 import numpy as np
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    #parquet and arrow sources are only available with pyarrow
+    pa = None
 
+#datasets converted to one .npy file per column plus metadata, can be moved with the INTREF_DATASET_CACHE environment variable
+DATASET_CACHE_DIR = os.environ.get("INTREF_DATASET_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "dataset_cache"))
+#rows parsed at once when a csv file is converted into the cache
+CSV_CHUNK_ROWS = 100000
+#file extensions of columnar sources, all other files are read as csv
+DATASET_FORMATS = {".parquet": "parquet", ".pq": "parquet", ".arrow": "arrow", ".feather": "arrow", ".ipc": "arrow"}
 
-def read_dataset(filepath, separator):
+
+def get_dataset_format(filepath):
+    """format of a data set (csv, parquet or arrow) by its file extension"""
+    return DATASET_FORMATS.get(os.path.splitext(filepath)[1].lower(), "csv")
+
+
+def read_arrow_table(filepath, columns=None):
+    """
+    Reads a parquet or arrow ipc/feather file, columns that are not requested are not read
+    :param filepath: the filepath to the data set
+    :param columns: the columns to read (None for all columns)
+    :return: the arrow table
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required to read {}".format(filepath))
+    if get_dataset_format(filepath) == "parquet":
+        return pq.read_table(filepath, columns=columns)
+    return feather.read_table(filepath, columns=columns, memory_map=True)
+
+
+def arrow_to_categorical(column):
+    """
+    Converts a string column of an arrow table into a categorical with sorted categories (LabelEncoder codes),
+    the codes are the dictionary indices remapped to the sorted order, values are not decoded
+    :param column: the arrow column (dictionary encoded or plain strings)
+    :return: the categorical
+    """
+    if not pa.types.is_dictionary(column.type):
+        column = pc.dictionary_encode(column)
+    #chunks (e.g. row groups) get one common dictionary
+    column = pa.table({"column": column}).unify_dictionaries().column(0)
+    if column.num_chunks == 0:
+        return pd.Categorical([])
+    dictionary = column.chunk(0).dictionary.to_numpy(zero_copy_only=False)
+    indices = np.concatenate([chunk.indices.fill_null(-1).to_numpy(zero_copy_only=False).astype(np.int64) for chunk in column.chunks])
+    #only values that occur are categories, like fitting a LabelEncoder on the values
+    used = np.flatnonzero(np.bincount(indices[indices >= 0], minlength=len(dictionary)))
+    order = np.argsort(dictionary[used], kind="stable")
+    sorted_codes = np.full(len(dictionary) + 1, -1, dtype=np.int64)
+    sorted_codes[used[order]] = np.arange(len(used))
+    return pd.Categorical.from_codes(sorted_codes[indices], dictionary[used[order]])
+
+
+def arrow_table_to_frame(table):
+    """
+    Converts an arrow table into a frame, string columns become categoricals (see arrow_to_categorical)
+    :param table: the arrow table
+    :return: the frame
+    """
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        value_type = column.type.value_type if pa.types.is_dictionary(column.type) else column.type
+        if pa.types.is_string(value_type) or pa.types.is_large_string(value_type):
+            columns[name] = arrow_to_categorical(column)
+        else:
+            if pa.types.is_dictionary(column.type):
+                column = pa.chunked_array([chunk.dictionary_decode() for chunk in column.chunks], type=value_type)
+            columns[name] = column.to_pandas().values
+    return pd.DataFrame(columns, columns=table.column_names)
+
+
+def project_columns(header, columns):
+    """requested columns in the order of the data set, None if all columns are requested"""
+    if columns is None:
+        return None
+    missing = [col for col in columns if col not in header]
+    if missing:
+        raise ValueError("Columns {} are not part of the data set".format(missing))
+    return [col for col in header if col in columns]
+
+
+def get_source_path(filepath):
+    """
+    Returns the file the data of a data set is read from (the students data set is read from its test file)
+    :param filepath: the filepath to the data set
+    :return: the filepath of the read file
+    """
+    if filepath == "Datasets/students_performance/student-mat_numerical.csv":
+        return "Datasets/students_performance/student-mat_numerical_test.csv"
+    return filepath
+
+
+def read_dataset(filepath, separator, encoding=None, columns=None):
     """
     Reads a given data set
     :param filepath: the filepath to the data set
-    :param separator: the separator used in the data set
+    :param separator: the separator used in the data set (ignored for parquet and arrow files)
+    :param encoding: the text encoding of the data set (None for the pandas default)
+    :param columns: the columns to read (None for all columns)
     :return: two values: 1. The data values, 2. The header
     """
+    columns = project_columns(read_dataset_header(filepath, separator, encoding), columns)
+    if get_dataset_format(filepath) != "csv":
+        df = arrow_table_to_frame(read_arrow_table(filepath, columns))
+        return df, df.columns
 
-    df = pd.read_csv(filepath, sep=separator)
+    df = pd.read_csv(filepath, sep=separator, encoding=encoding, usecols=columns)
     # if filepath == "seeds/seeds_dataset.txt":
     #    df.drop(['class'], axis=1, inplace=True)
     if filepath == "Datasets/students_performance/student-mat_numerical.csv":
         # df.drop(['G1', 'G2', 'G3'], axis=1, inplace=True)
-        df = pd.read_csv("Datasets/students_performance/student-mat_numerical_test.csv", sep=separator)
-        df.drop(['G1', 'G2'], axis=1, inplace=True)
+        df = pd.read_csv(get_source_path(filepath), sep=separator, encoding=encoding, usecols=columns)
+        df.drop(['G1', 'G2'], axis=1, inplace=True, errors="ignore")
     return df, df.columns
 
 
+def get_dataset_cache_path(filepath, separator, encoding=None, columns=None):
+    """
+    Returns the cache directory of a data set, keyed by path, separator, encoding, columns, size and modification time of the file
+    the data is read from
+    :param filepath: the filepath to the data set
+    :param separator: the separator used in the data set
+    :param encoding: the text encoding of the data set
+    :param columns: the columns of the data set that are read (None for all columns)
+    :return: path of the cache directory
+    """
+    stat = os.stat(get_source_path(filepath))
+    key = "\n".join([os.path.abspath(filepath), separator, str(encoding), str(columns), str(stat.st_size), str(stat.st_mtime_ns)])
+    return os.path.join(DATASET_CACHE_DIR, hashlib.sha1(key.encode()).hexdigest())
+
+
+def narrow_dtype(dtype, min_value, max_value, float32_exact):
+    """
+    Returns the smallest dtype holding all values of a numeric column exactly
+    :param dtype: the dtype pandas inferred for the column
+    :param min_value: smallest value of the column
+    :param max_value: largest value of the column
+    :param float32_exact: true if all values of a float column are exact in float32
+    :return: the narrow dtype (dtype itself if no smaller one fits)
+    """
+    if dtype.kind in "iu":
+        for int_dtype in (np.int8, np.int16, np.int32):
+            if np.iinfo(int_dtype).min <= min_value and max_value <= np.iinfo(int_dtype).max:
+                return np.dtype(int_dtype)
+    if dtype.kind == "f" and float32_exact:
+        return np.dtype(np.float32)
+    return dtype
+
+
+def code_dtype(n_categories):
+    """smallest signed integer dtype for the codes of n categories (-1 marks missing values)"""
+    for int_dtype in (np.int8, np.int16, np.int32):
+        if n_categories <= np.iinfo(int_dtype).max:
+            return np.dtype(int_dtype)
+    return np.dtype(np.int64)
+
+
+def is_float32_exact(values):
+    """true if all values (nan included) survive a round trip through float32"""
+    with np.errstate(over="ignore"):
+        return bool(np.array_equal(values.astype(np.float32).astype(values.dtype), values, equal_nan=True))
+
+
+def is_string_dtype(dtype):
+    return dtype == object or isinstance(dtype, pd.CategoricalDtype)
+
+
+def create_cache_dir():
+    """temporary directory a cache is written to, readers never see a partially written cache"""
+    os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+    return tempfile.mkdtemp(dir=DATASET_CACHE_DIR)
+
+
+def publish_cache_dir(tmp_path, cache_path, meta):
+    """write the metadata and move a completely written cache to its final directory"""
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    try:
+        os.rename(tmp_path, cache_path)
+    except OSError:
+        #another process created the cache in the meantime
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not os.path.isdir(cache_path):
+            raise
+
+
+def write_dataset_cache(df, cache_path):
+    """
+    Converts a parsed data set into the cache layout: one .npy file per column, string columns as codes of their
+    sorted categories which are stored in meta.json together with the header
+    :param df: the parsed data set
+    :param cache_path: the cache directory of the data set
+    """
+    tmp_path = create_cache_dir()
+    try:
+        meta = {"n_rows": len(df), "columns": []}
+        for index, col in enumerate(df.columns):
+            column = {"name": col, "file": "col_{}.npy".format(index)}
+            values = df[col].values
+            if is_string_dtype(df[col].dtype):
+                values = pd.Categorical(values)
+                column["categories"] = values.categories.tolist()
+                values = values.codes.astype(code_dtype(len(column["categories"])))
+            elif values.dtype.kind in "iuf" and len(values) > 0:
+                values = values.astype(narrow_dtype(values.dtype, np.nanmin(values), np.nanmax(values),
+                                                    values.dtype.kind == "f" and is_float32_exact(values)))
+            np.save(os.path.join(tmp_path, column["file"]), np.asarray(values), allow_pickle=False)
+            meta["columns"].append(column)
+        publish_cache_dir(tmp_path, cache_path, meta)
+    except (OSError, TypeError, ValueError):
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def stream_dataset_cache(filepath, separator, encoding, cache_path, columns=None, chunk_rows=CSV_CHUNK_ROWS):
+    """
+    Converts a csv file into the cache layout without holding the whole file in memory
+
+    The first pass over the chunks infers the dtype per column: the dtype pandas inferred over all chunks narrowed
+    to the smallest integer type or to float32 if all values are exact, columns with strings in any chunk are string
+    columns. The second pass writes every chunk directly into the memory mapped column files, string values get
+    codes in order of appearance which are remapped to the codes of the sorted categories (LabelEncoder codes) in the end.
+    :param filepath: the filepath to the data set
+    :param separator: the separator used in the data set
+    :param encoding: the text encoding of the data set
+    :param cache_path: the cache directory of the data set
+    :param columns: the columns to read (None for all columns)
+    :param chunk_rows: number of rows parsed at once
+    """
+    header = pd.read_csv(filepath, sep=separator, encoding=encoding, nrows=0, usecols=columns).columns
+    stats = {col: {"dtype": None, "min": np.inf, "max": -np.inf, "float32": True} for col in header}
+    n_rows = 0
+    for chunk in pd.read_csv(filepath, sep=separator, encoding=encoding, chunksize=chunk_rows, usecols=columns):
+        n_rows += len(chunk)
+        for col in header:
+            col_stats, values = stats[col], chunk[col].values
+            if col_stats["dtype"] == object or values.dtype == object or values.dtype.kind not in "biuf":
+                col_stats["dtype"] = np.dtype(object)
+                continue
+            col_stats["dtype"] = values.dtype if col_stats["dtype"] is None else np.result_type(col_stats["dtype"], values.dtype)
+            present = values[~np.isnan(values)] if values.dtype.kind == "f" else values
+            if values.dtype.kind in "iuf" and len(present) > 0:
+                col_stats["min"] = min(col_stats["min"], present.min())
+                col_stats["max"] = max(col_stats["max"], present.max())
+            #integer chunks are checked too, a float value in another chunk turns the whole column into a float column
+            if values.dtype.kind in "iuf" and col_stats["float32"]:
+                col_stats["float32"] = is_float32_exact(values)
+    dtypes = {}
+    for col in header:
+        dtype = stats[col]["dtype"] if stats[col]["dtype"] is not None else np.dtype(object)
+        if dtype != object and dtype.kind != "b" and stats[col]["min"] <= stats[col]["max"]:
+            dtype = narrow_dtype(dtype, stats[col]["min"], stats[col]["max"], stats[col]["float32"])
+        dtypes[col] = dtype
+    string_columns = [col for col in header if dtypes[col] == object]
+    tmp_path = create_cache_dir()
+    try:
+        meta = {"n_rows": n_rows, "columns": []}
+        column_files, categories, string_codes = {}, {}, {}
+        for index, col in enumerate(header):
+            meta["columns"].append({"name": col, "file": "col_{}.npy".format(index)})
+            if col in string_columns:
+                #codes in order of appearance, values of all chunks are parsed as strings like a single read would do
+                categories[col] = {}
+                string_codes[col] = np.empty(n_rows, dtype=np.int32)
+            else:
+                column_files[col] = np.lib.format.open_memmap(os.path.join(tmp_path, meta["columns"][-1]["file"]), mode="w+",
+                                                             dtype=dtypes[col], shape=(n_rows,))
+        start = 0
+        reader = pd.read_csv(filepath, sep=separator, encoding=encoding, chunksize=chunk_rows, usecols=columns,
+                             dtype={col: str for col in string_columns})
+        for chunk in reader:
+            end = start + len(chunk)
+            for col in header:
+                if col in string_columns:
+                    values = pd.Categorical(chunk[col].values)
+                    for value in values.categories:
+                        categories[col].setdefault(value, len(categories[col]))
+                    chunk_codes = np.array([categories[col][value] for value in values.categories] + [-1], dtype=np.int64)
+                    string_codes[col][start:end] = chunk_codes[values.codes]
+                else:
+                    column_files[col][start:end] = chunk[col].values
+            start = end
+        for index, col in enumerate(header):
+            if col in string_columns:
+                values = sorted(categories[col])
+                #code of appearance -> code of sorted category, -1 (missing value) stays -1
+                sorted_codes = np.empty(len(values) + 1, dtype=np.int64)
+                sorted_codes[[categories[col][value] for value in values]] = np.arange(len(values))
+                sorted_codes[-1] = -1
+                codes = sorted_codes[string_codes.pop(col)].astype(code_dtype(len(values)))
+                np.save(os.path.join(tmp_path, meta["columns"][index]["file"]), codes, allow_pickle=False)
+                meta["columns"][index]["categories"] = values
+            else:
+                column_files.pop(col).flush()
+        publish_cache_dir(tmp_path, cache_path, meta)
+    except (OSError, TypeError, ValueError):
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def read_dataset_cache(cache_path):
+    """
+    Loads a data set from the cache, columns are memory mapped and not copied
+    :param cache_path: the cache directory of the data set
+    :return: the data values with string columns as categoricals
+    """
+    with open(os.path.join(cache_path, "meta.json")) as f:
+        meta = json.load(f)
+    columns = {}
+    for column in meta["columns"]:
+        values = np.load(os.path.join(cache_path, column["file"]), mmap_mode="r", allow_pickle=False)
+        if "categories" in column:
+            values = pd.Categorical.from_codes(values, column["categories"])
+        columns[column["name"]] = values
+    return pd.DataFrame(columns, columns=[column["name"] for column in meta["columns"]], copy=False)
+
+
+def load_dataset(filepath, separator, encoding=None, columns=None):
+    """
+    Reads a given data set through the column cache, the source file is only parsed if it is not cached yet
+    :param filepath: the filepath to the data set
+    :param separator: the separator used in the data set (ignored for parquet and arrow files)
+    :param encoding: the text encoding of the data set (None for the pandas default)
+    :param columns: the columns to read (None for all columns)
+    :return: two values: 1. The data values (string columns as categoricals), 2. The header
+    """
+    columns = project_columns(read_dataset_header(filepath, separator, encoding), columns)
+    cache_path = get_dataset_cache_path(filepath, separator, encoding, columns)
+    if not os.path.isdir(cache_path):
+        try:
+            if get_dataset_format(filepath) != "csv" or filepath == "Datasets/students_performance/student-mat_numerical.csv":
+                #columnar files are read at once, data of the students data set is read from another file (see read_dataset)
+                write_dataset_cache(read_dataset(filepath, separator, encoding, columns)[0], cache_path)
+            else:
+                stream_dataset_cache(filepath, separator, encoding, cache_path, columns)
+        except (OSError, TypeError, ValueError):
+            #columns that can not be converted (e.g. mixed types) or no writable cache --> use parsed data
+            return read_dataset(filepath, separator, encoding, columns)
+    df = read_dataset_cache(cache_path)
+    return df, df.columns
+
+
+def read_dataset_header(filepath, separator, encoding=None):
+    """
+    Returns the header of a data set from the cache metadata, only the first line (or the schema of parquet and
+    arrow files) is read if it is not cached
+    :param filepath: the filepath to the data set
+    :param separator: the separator used in the data set
+    :param encoding: the text encoding of the data set
+    :return: a list of attributes
+    """
+    meta_path = os.path.join(get_dataset_cache_path(filepath, separator, encoding), "meta.json")
+    if os.path.isfile(meta_path):
+        with open(meta_path) as f:
+            return [column["name"] for column in json.load(f)["columns"]]
+    if get_dataset_format(filepath) != "csv":
+        if pa is None:
+            raise ImportError("pyarrow is required to read {}".format(filepath))
+        if get_dataset_format(filepath) == "parquet":
+            return pq.read_schema(filepath).names
+        with pa.memory_map(filepath) as source:
+            return pa.ipc.open_file(source).schema.names
+    return pd.read_csv(filepath, sep=separator, encoding=encoding, nrows=0).columns.tolist()
+
+
 def get_attributes_of_dataset(filepath, separator):
     """
     Returns the attributes (header) of the dataset
@@ -27,14 +383,15 @@ def get_attributes_of_dataset(filepath, separator):
     :param separator: the separator used in the data set
     :return: a list of attributes
     """
-    df = pd.read_csv(filepath, sep=separator)
+    header = read_dataset_header(filepath, separator)
+    dropped = []
     if filepath == "Datasets/seeds/seeds_dataset.txt":
-        df.drop(['class'], axis=1, inplace=True)
+        dropped = ['class']
     elif filepath == "Datasets/students_performance/student-mat_numerical.csv":
-        df.drop(['G1', 'G2', 'class'], axis=1, inplace=True)
+        dropped = ['G1', 'G2', 'class']
     elif filepath == "Datasets/synthetic/synthetic.csv":
-        df.drop(['class'], axis=1, inplace=True)
-    return df.columns.tolist()
+        dropped = ['class']
+    return [att for att in header if att not in dropped]
 
 
 def create_clusters(clusters, data):